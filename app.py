@@ -7,12 +7,14 @@ Date: 20/08/2023
 
 import os
 
-from fastapi import FastAPI, status
+from anyio import to_thread
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 from backenduser.route import backendUserRoutes
+from database import POOL_OPTIONS, count_queries, engine
 from dependencies import SETTINGS, TEMPLATES
 from frontenduser.route import frontendUserRoutes
 from organization.route import organizationRoutes
@@ -41,6 +43,44 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def limit_worker_threads():
+    """
+    Sync endpoints and dependencies run in the threadpool and each holds a
+    database connection, so the threadpool never outgrows the connection pool.
+    More threads would only wait on `pool_timeout` for a free connection.
+    A larger pool keeps anyio's default thread count.
+    """
+    if POOL_OPTIONS:
+        limiter = to_thread.current_default_thread_limiter()
+        limiter.total_tokens = min(
+            limiter.total_tokens, SETTINGS.DB_POOL_SIZE + SETTINGS.DB_MAX_OVERFLOW
+        )
+
+
+@app.on_event("shutdown")
+def close_database_pool():
+    """
+    Closes the pooled database connections when the server stops,
+    instead of leaving them for the database to time out.
+    """
+    engine.dispose()
+
+
+if SETTINGS.DEVELOPMENT:
+
+    @app.middleware("http")
+    async def add_query_count(request: Request, call_next):
+        """
+        Adds the number of SQL statements executed by a request
+        to the `X-Query-Count` response header.
+        """
+        with count_queries() as counter:
+            response = await call_next(request)
+        response.headers["X-Query-Count"] = str(counter[0])
+        return response
+
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
@@ -9,8 +9,10 @@ import secrets
 from datetime import datetime, timedelta
 
 from fastapi import BackgroundTasks, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
+from cache import cache_delete
 from dependencies import (
     TOKEN_LIMIT,
     TOKEN_VALIDITY,
@@ -64,7 +66,7 @@ def create_user(
     """
     # Check if a user with the same email or username already exists in the database
     existing_user = (
-        sql.query(model.BackendUser)
+        sql.query(model.BackendUser.username, model.BackendUser.email)
         .filter(
             (model.BackendUser.email == user.email)
             | (model.BackendUser.username == user.username)
@@ -442,9 +444,9 @@ def create_permission(request: schema.BasePermission, sql: Session):
     """
     Creates a new permission in the database.
     """
-    existing_permission = (
-        sql.query(model.BackendPermission).filter_by(codename=request.codename).first()
-    )
+    existing_permission = sql.query(
+        sql.query(model.BackendPermission).filter_by(codename=request.codename).exists()
+    ).scalar()
     if existing_permission:
         CustomValidations.raize_custom_error(
             error_type="exist",
@@ -525,19 +527,22 @@ def assign_permissions(
 
     codenames = request.permissions
     permissions = (
-        sql.query(model.BackendPermission)
+        sql.query(model.BackendPermission.id)
         .filter(model.BackendPermission.codename.in_(codenames))
         .all()
     )
 
     sql.query(model.BackendRolePermission).filter_by(role_id=role.id).delete()
 
-    sql.commit()
-    for permission in permissions:
-        role_permission = model.BackendRolePermission(
-            role_id=role.id, permission_id=permission.id
+    # Insert the role permissions with one executemany, no ORM objects needed
+    if permissions:
+        sql.execute(
+            insert(model.BackendRolePermission),
+            [
+                {"role_id": role.id, "permission_id": permission.id}
+                for permission in permissions
+            ],
         )
-        sql.add(role_permission)
 
     sql.commit()
     sql.refresh(role)
@@ -705,6 +710,7 @@ def update_subscription_plan(data: schema.UpdateSubscription, sql: Session):
 
         # Commit the changes to the database
         sql.commit()
+        cache_delete(f"plan_features:{subscription.id}")
         sql.refresh(subscription_feature)
 
     # Return the updated subscription object
@@ -815,4 +821,5 @@ def create_subscription_user(
     sql.add(subscription_user)
     sql.commit()
     sql.refresh(subscription_user)
+    cache_delete(f"subscription_expiry:{user_id}:{subscription.id}")
     return subscription_user
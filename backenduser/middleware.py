@@ -4,18 +4,32 @@ backenduser/middleware.py
 Author: Gourav Sahu
 Date: 23/09/2023
 """
-from datetime import datetime
 from typing import Annotated
 
 from fastapi import Depends, Header, status
-from sqlalchemy.orm import Session
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.orm import Session, joinedload
 
 from backenduser.model import BackendToken
 from database import get_db
-from dependencies import CustomValidations
+from dependencies import CustomValidations, utcnow
 
 
-async def authenticate_token(
+def get_token(sql: Session, authtoken: str):
+    """
+    Returns the backend login token row for `authtoken` with its user, or None.
+    Runs on every backend request, so the statement is a cached lambda.
+    """
+    return sql.scalars(
+        lambda_stmt(
+            lambda: select(BackendToken)
+            .where(BackendToken.token == authtoken)
+            .options(joinedload(BackendToken.user))
+        )
+    ).first()
+
+
+def authenticate_token(
     authtoken: Annotated[
         str,
         Header(
@@ -27,7 +41,7 @@ async def authenticate_token(
     """
     Check the validity of the provided token and return the associated user.
     """
-    user_token = sql.query(BackendToken).filter_by(token=authtoken).first()
+    user_token = get_token(sql, authtoken)
 
     if not user_token:
         CustomValidations.raize_custom_error(
@@ -53,7 +67,7 @@ async def authenticate_token(
             ctx={"authtoken": "valid"},
         )
 
-    if datetime.utcnow() > user_token.expire_at:
+    if utcnow() > user_token.expire_at:
         CustomValidations.raize_custom_error(
             status_code=status.HTTP_401_UNAUTHORIZED,
             error_type="expired",
@@ -70,6 +84,8 @@ def check_permission(codenames: list[str]):
     """
     Returns a function to check if a user has the required permissions.
     """
+    # Built once per route, not on every request
+    required_codenames = frozenset(codenames)
 
     def has_permissions(
         authtoken: Annotated[
@@ -85,7 +101,7 @@ def check_permission(codenames: list[str]):
         Checks if a user has the required permissions.
         Comparing the user's permission codenames with the provided list of codenames.
         """
-        user_token = sql.query(BackendToken).filter_by(token=authtoken).first()
+        user_token = get_token(sql, authtoken)
 
         if not user_token or not user_token.user:
             CustomValidations.raize_custom_error(
@@ -101,11 +117,11 @@ def check_permission(codenames: list[str]):
             return "__all__"
 
         user_permissions = user_token.user.role.permissions
-        user_permission_codenames = [
+        user_permission_codenames = {
             item.permission.codename for item in user_permissions
-        ]
+        }
 
-        if not all(codename in user_permission_codenames for codename in codenames):
+        if not required_codenames <= user_permission_codenames:
             CustomValidations.raize_custom_error(
                 status_code=status.HTTP_403_FORBIDDEN,
                 error_type="unauthenticated",
@@ -115,6 +131,6 @@ def check_permission(codenames: list[str]):
                 ctx={"permission": ", ".join(codenames)},
             )
 
-        return user_permission_codenames
+        return list(user_permission_codenames)
 
     return has_permissions
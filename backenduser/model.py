@@ -12,10 +12,12 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     exc,
+    insert,
 )
 from sqlalchemy.orm import relationship
 
@@ -125,11 +127,7 @@ def create_permissions():
     print("Creating permissions data...")
     try:
         sql = SessionLocal()
-        permissions = [
-            BackendPermission(**permission)
-            for permission in predefined_backend_permissions
-        ]
-        sql.add_all(permissions)
+        sql.execute(insert(BackendPermission), predefined_backend_permissions)
         sql.commit()
     except exc.IntegrityError:
         sql.rollback()
@@ -162,15 +160,6 @@ class BackendRolePermission(Base):
             ">"
         )
 
-    def __str__(self):
-        return (
-            "<BackendRolePermission("
-            f"id={self.id}, "
-            f"role_id={self.role_id}, "
-            f"permission_id={self.permission_id})"
-            ">"
-        )
-
 
 class BackendToken(Base):
     """
@@ -233,6 +222,10 @@ class SubscriptionUser(Base):
     """
 
     __tablename__ = "subscription_users"
+    __table_args__ = (
+        # Latest expiry of a user's active plan, read by the subscription checks
+        Index("ix_subuser_user_plan", "user_id", "subscription_id", "expiry"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     subscription_id = Column(Integer, ForeignKey("subscriptions.id"))
@@ -260,19 +253,6 @@ class SubscriptionUser(Base):
             ">"
         )
 
-    def __str__(self):
-        """
-        Returns a string representation of the SubscriptionUser object.
-        """
-        return (
-            "<SubscriptionUser("
-            f"id={self.id}, "
-            f"subscription_id={self.subscription_id}, "
-            f"user_id={self.user_id}, "
-            f"transaction_id={self.transaction_id})"
-            ">"
-        )
-
 
 class Feature(Base):
     """
@@ -298,15 +278,6 @@ class Feature(Base):
             ")"
         )
 
-    def __str__(self):
-        return (
-            "Feature("
-            f"id={self.id}, "
-            f"feature_type='{self.feature_type}', "
-            f"feature_code='{self.feature_code}'"
-            ")"
-        )
-
 
 def create_features():
     """
@@ -315,8 +286,7 @@ def create_features():
     try:
         print("Creating features data...")
         sql = SessionLocal()
-        features = [Feature(**feature) for feature in predefined_feature]
-        sql.add_all(features)
+        sql.execute(insert(Feature), predefined_feature)
         sql.commit()
     except exc.IntegrityError:
         sql.rollback()
@@ -331,6 +301,10 @@ class SubscriptionFeature(Base):
     """
 
     __tablename__ = "subscription_features"
+    __table_args__ = (
+        # Features of a plan, read by the feature checks
+        Index("ix_subfeature_plan_feature", "subscription_id", "feature_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     subscription_id = Column(Integer, ForeignKey("subscriptions.id"))
@@ -352,17 +326,6 @@ class SubscriptionFeature(Base):
             ")"
         )
 
-    def __str__(self):
-        return (
-            "SubscriptionFeature("
-            f"id={self.id}, "
-            f"subscription_id={self.subscription_id}, "
-            f"feature_id={self.feature_id}, "
-            f"quantity={self.quantity}, "
-            f"created_at={self.created_at}"
-            ")"
-        )
-
 
 class Coupon(Base):
     """
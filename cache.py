@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+cache.py
+Author: Gourav Sahu
+Date: 17/10/2026
+
+Small read-through cache for hot lookups.
+
+Values are stored in Redis when `REDIS_URL` is configured, so every worker
+shares them, otherwise in a process-local TTL cache.
+Only JSON serializable values can be cached.
+Values that must never outlive a revocation are cached with `shared_only`,
+a process-local entry can not be cleared from the worker handling the write.
+"""
+import threading
+
+import orjson
+from cachetools import TLRUCache
+
+from dependencies import SETTINGS
+
+# Process-local fallback, every entry is stored as (ttl, value)
+LOCAL_CACHE = TLRUCache(maxsize=4096, ttu=lambda _key, entry, now: now + entry[0])
+LOCAL_CACHE_LOCK = threading.Lock()
+REDIS_CLIENT = None
+
+
+def get_redis():
+    """
+    Returns the shared Redis client, or None when `REDIS_URL` is not set.
+    The client keeps its own connection pool, so it is created only once.
+    """
+    global REDIS_CLIENT  # pylint: disable=global-statement
+    if not SETTINGS.REDIS_URL:
+        return None
+
+    if REDIS_CLIENT is None:
+        import redis  # pylint: disable=import-outside-toplevel
+
+        REDIS_CLIENT = redis.Redis.from_url(SETTINGS.REDIS_URL)
+    return REDIS_CLIENT
+
+
+def cache_get(key: str, shared_only: bool = False):
+    """
+    Returns the cached value of `key`, or None if it is missing or expired.
+    With `shared_only` the process-local cache is never read.
+    """
+    client = get_redis()
+    if client is not None:
+        value = client.get(key)
+        return orjson.loads(value) if value is not None else None
+
+    if shared_only:
+        return None
+
+    with LOCAL_CACHE_LOCK:
+        entry = LOCAL_CACHE.get(key)
+    return entry[1] if entry else None
+
+
+def cache_set(key: str, value, ttl: int = None, shared_only: bool = False):
+    """
+    Caches `value` under `key` for `ttl` seconds (`CACHE_TTL` by default).
+    With `shared_only` nothing is cached unless Redis is configured.
+    """
+    ttl = ttl or SETTINGS.CACHE_TTL
+    client = get_redis()
+    if client is not None:
+        client.set(key, orjson.dumps(value), ex=ttl)
+        return
+
+    if shared_only:
+        return
+
+    with LOCAL_CACHE_LOCK:
+        LOCAL_CACHE[key] = (ttl, value)
+
+
+def cache_delete(key: str):
+    """
+    Removes `key` from the cache, call it whenever the cached data changes.
+    """
+    client = get_redis()
+    if client is not None:
+        client.delete(key)
+        return
+
+    with LOCAL_CACHE_LOCK:
+        LOCAL_CACHE.pop(key, None)
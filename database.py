@@ -11,6 +11,15 @@ Classes:
     - Session: A utility for managing database sessions.
     - initialize_database: Function to initialize the database connection and create tables.
     - get_db: FastAPI dependency function to provide a database session to route handlers.
+    - random_uid: SQL expression used as server default for uid columns.
+    - utc_timestamp: SQL expression of the current UTC time, for timestamp columns.
+    - count_queries: Context manager counting the SQL statements executed inside it.
+    - paginate: Fetch one page of a query, by offset or by keyset cursor.
+    - load_options: Loader options of a query, strict about lazy loads when enabled.
+    - has_unique_key: Whether a model unique key exists in the database.
+    - insert_or_ignore: Insert a row unless it conflicts with a unique key, in one query.
+    - insert_many_or_ignore: Insert rows skipping those that conflict, in one query.
+    - update_returning: Update the rows matching a criteria and return the first one.
 
 Usage:
     1. Import `Base` and define your database models by subclassing it.
@@ -37,21 +46,344 @@ Author: Gourav Sahu
 Date: 20/08/2023
 
 """
+import base64
+import binascii
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-from sqlalchemy import create_engine
+import orjson
+from sqlalchemy import (
+    DateTime,
+    String,
+    create_engine,
+    event,
+    func,
+    inspect,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Query, Session, raiseload, sessionmaker
+from sqlalchemy.sql.expression import FunctionElement
 
-from dependencies import SETTINGS
+from dependencies import SETTINGS, CustomValidations
 
 DATABASE_URL = SETTINGS.DB_URL
 
-engine = create_engine(DATABASE_URL)
+# Keep a warm pool of checked connections instead of reconnecting per request.
+# SQLite connections are local files, the pool sizing only applies to servers.
+POOL_OPTIONS = (
+    {}
+    if DATABASE_URL.startswith("sqlite")
+    else {
+        "pool_size": SETTINGS.DB_POOL_SIZE,
+        "max_overflow": SETTINGS.DB_MAX_OVERFLOW,
+        "pool_timeout": SETTINGS.DB_POOL_TIMEOUT,
+        "pool_recycle": SETTINGS.DB_POOL_RECYCLE,
+    }
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads,
+    # Compiled SQL is cached per statement shape, sized for all the app queries
+    query_cache_size=SETTINGS.DB_QUERY_CACHE_SIZE,
+    **POOL_OPTIONS,
+)
+
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 Base = declarative_base()
 
+# Statement counter of the running request, set by `count_queries`
+QUERY_COUNTER: ContextVar[list | None] = ContextVar("query_counter", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(*args):  # pylint: disable=W0613
+    counter = QUERY_COUNTER.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the SQL statements executed inside the block.
+    Used to keep an eye on N+1 queries in development.
+
+    Example Usage:
+    with count_queries() as counter:
+        ...
+    print(counter[0])
+    """
+    counter = [0]
+    token = QUERY_COUNTER.set(counter)
+    try:
+        yield counter
+    finally:
+        QUERY_COUNTER.reset(token)
+
+
+class random_uid(FunctionElement):  # pylint: disable=C0103
+    """
+    SQL expression generating a random 32 character hex uid inside the database.
+    Use it as `server_default` of uid columns instead of generating them in Python.
+    """
+
+    type = String()
+    inherit_cache = True
+
+
+@compiles(random_uid)
+def _random_uid_default(element, compiler, **kw):  # pylint: disable=W0613
+    return "(replace(uuid(), '-', ''))"
+
+
+@compiles(random_uid, "sqlite")
+def _random_uid_sqlite(element, compiler, **kw):  # pylint: disable=W0613
+    return "lower(hex(randomblob(16)))"
+
+
+@compiles(random_uid, "postgresql")
+def _random_uid_postgresql(element, compiler, **kw):  # pylint: disable=W0613
+    return "replace(gen_random_uuid()::text, '-', '')"
+
+
+class utc_timestamp(FunctionElement):  # pylint: disable=C0103
+    """
+    SQL expression of the current naive UTC time, computed by the database.
+    Use it as `server_default` and `onupdate` of timestamp columns
+    instead of sending a Python `datetime` with every row.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_timestamp)
+def _utc_timestamp_default(element, compiler, **kw):  # pylint: disable=W0613
+    return "(utc_timestamp(6))"
+
+
+@compiles(utc_timestamp, "sqlite")
+def _utc_timestamp_sqlite(element, compiler, **kw):  # pylint: disable=W0613
+    return "(strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+
+
+@compiles(utc_timestamp, "postgresql")
+def _utc_timestamp_postgresql(element, compiler, **kw):  # pylint: disable=W0613
+    return "(now() at time zone 'utc')"
+
+
+def load_options(*loads):
+    """
+    Returns the loader options for a query.
+    When `SQLA_RAISELOAD` is enabled every relationship not loaded by `loads`
+    raises on access instead of silently emitting a lazy SELECT.
+    """
+    if SETTINGS.SQLA_RAISELOAD:
+        return [*loads, raiseload("*")]
+    return list(loads)
+
+
+# Unique keys found in the database, by (table name, columns)
+UNIQUE_KEYS: dict[tuple[str, frozenset], bool] = {}
+
+
+def has_unique_key(sql: Session, model, columns: list[str]) -> bool:
+    """
+    Returns whether the table of `model` has a unique key on exactly `columns`.
+    `create_all` does not add constraints to existing tables, so a key declared
+    on the model may be missing from an older database.
+    The schema is inspected once per process, restart after adding a key.
+    """
+    table = model.__tablename__
+    key = (table, frozenset(columns))
+    if key not in UNIQUE_KEYS:
+        inspector = inspect(sql.connection())
+        keys = [
+            constraint["column_names"]
+            for constraint in inspector.get_unique_constraints(table)
+        ]
+        keys += [
+            index["column_names"]
+            for index in inspector.get_indexes(table)
+            if index["unique"]
+        ]
+        keys.append(inspector.get_pk_constraint(table)["constrained_columns"])
+        UNIQUE_KEYS[key] = any(set(cols) == set(columns) for cols in keys)
+    return UNIQUE_KEYS[key]
+
+
+def insert_or_ignore(sql: Session, model, values: dict, index_elements: list[str]):
+    """
+    Inserts a row with `INSERT ... ON CONFLICT DO NOTHING RETURNING`,
+    so the uniqueness check and the insert are a single atomic statement.
+    If the database lacks the unique key on `index_elements`, the row is
+    looked up first and inserted only when missing.
+
+    Returns:
+        The inserted object, or None if a row with the same
+        `index_elements` (a unique constraint of `model`) already exists.
+    """
+    if not has_unique_key(sql, model, index_elements):
+        criteria = {column: values[column] for column in index_elements}
+        if sql.query(sql.query(model).filter_by(**criteria).exists()).scalar():
+            return None
+        obj = model(**values)
+        sql.add(obj)
+        sql.flush()
+        return obj
+
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    dialect = dialects.get(sql.get_bind().dialect.name)
+
+    if dialect is None:
+        # No ON CONFLICT support, let the unique constraint reject the row.
+        try:
+            with sql.begin_nested():
+                obj = model(**values)
+                sql.add(obj)
+            return obj
+        except IntegrityError:
+            return None
+
+    stmt = (
+        dialect.insert(model)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=index_elements)
+        .returning(model)
+    )
+    return sql.scalars(stmt).first()
+
+
+def insert_many_or_ignore(
+    sql: Session, model, rows: list[dict], index_elements: list[str]
+):
+    """
+    Inserts all `rows` with one multi-row `INSERT ... ON CONFLICT DO NOTHING`,
+    rows that conflict on `index_elements` are skipped.
+    """
+    if not rows:
+        return
+
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    dialect = dialects.get(sql.get_bind().dialect.name)
+
+    if dialect is None or not has_unique_key(sql, model, index_elements):
+        for values in rows:
+            insert_or_ignore(sql, model, values, index_elements)
+        return
+
+    sql.execute(
+        dialect.insert(model)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=index_elements)
+    )
+
+
+def update_returning(sql: Session, model, criteria, values: dict):
+    """
+    Updates the `model` rows matching `criteria` with `values` and returns the
+    first of them, with a single `UPDATE ... RETURNING` where the dialect has it.
+    `criteria` may reference other tables, they become `UPDATE ... FROM`.
+
+    Returns:
+        The updated object, or None if no row matched.
+    """
+    stmt = update(model).where(*criteria).values(**values)
+    if sql.get_bind().dialect.update_returning:
+        return sql.scalars(stmt.returning(model)).first()
+
+    sql.execute(stmt)
+    return sql.query(model).filter(*criteria).first()
+
+
+def encode_cursor(value) -> str:
+    """
+    Encodes the key of the last item of a page into an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(str(value).encode()).decode()
+
+
+def keyset_page(query: Query, key_column, cursor: str, limit: int):
+    """
+    Fetches the page of `query` that follows `cursor` with
+    `key_column > last seen key`, so no rows are scanned and discarded by OFFSET.
+    One extra row is fetched to know whether a next page exists.
+
+    Returns:
+        tuple: (items, next_cursor)
+    """
+    if cursor:
+        try:
+            last_key = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (ValueError, binascii.Error):
+            CustomValidations.raize_custom_error(
+                error_type="invalid",
+                loc="cursor",
+                msg="Invalid cursor",
+                inp=cursor,
+                ctx={"cursor": "valid"},
+            )
+        query = query.filter(key_column > last_key)
+
+    items = query.order_by(key_column).limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    return items, encode_cursor(getattr(items[-1], key_column.key))
+
+
+def paginate(
+    query: Query, key_column, limit: int, offset: int = 0, cursor: str = None
+):
+    """
+    Fetches one page of `query` ordered by `key_column`.
+
+    Without a cursor the page is taken by offset and the total number of rows
+    is counted by `COUNT(*) OVER ()` in the same query.
+    With a cursor the page is taken by keyset and no total is counted.
+    Queries of a single entity return instances, column queries return rows.
+
+    Returns:
+        tuple: (items, total, next_cursor), total is None in cursor mode.
+    """
+    if cursor is not None:
+        items, next_cursor = keyset_page(query, key_column, cursor, limit)
+        return items, None, next_cursor
+
+    rows = (
+        query.add_columns(func.count().over())
+        .order_by(key_column)
+        .limit(limit)
+        .offset(offset)
+        .all()
+    )
+    if not rows:
+        # An empty page past the end still has to report the real total.
+        total = query.order_by(None).count() if offset else 0
+        return [], total, None
+
+    total = rows[0][-1]
+    if len(query.column_descriptions) == 1:
+        items = [row[0] for row in rows]
+    else:
+        # Column queries keep the whole row, the window count is left unused
+        items = rows
+    next_cursor = None
+    if offset + len(items) < total:
+        next_cursor = encode_cursor(getattr(items[-1], key_column.key))
+    return items, total, next_cursor
+
 
 # @contextmanager
 def get_db():
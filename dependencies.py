@@ -5,20 +5,26 @@ Author: Gourav Sahu
 Date: 23/09/2023
 """
 import base64
+import hashlib
 import math
 import os
-import random
 import re
 import secrets
 import smtplib
+import threading
 import time
 import urllib.parse
+import uuid
+from datetime import datetime, timezone
 from email.message import EmailMessage
 from email.mime.text import MIMEText
 from typing import Optional
 
+import orjson
 import requests
+from cachetools import TTLCache
 from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
@@ -38,12 +44,20 @@ class Settings(BaseSettings):
     APP_URL: HttpUrl = "http://127.0.0.1:8000"
     ALLOWED_ORIGINS: list[str]
     DB_URL: str = "sqlite:///./sql_app.db"
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 3600
+    DB_QUERY_CACHE_SIZE: int = 1200
     DEBUG: bool = True
     LANGUAGE_CODE: str = "en-us"
     USE_TZ: bool = True
     TIME_ZONE: str = "UTC"
     DEFAULT_CURRENCY: str = "USD"
     DEVELOPMENT: bool = True
+    SQLA_RAISELOAD: bool = False
+    REDIS_URL: Optional[str] = None
+    CACHE_TTL: int = 60
     MAIL_HOST: str = "smtp.gmail.com"
     MAIL_PORT: int = 587
     MAIL_USERNAME: EmailStr
@@ -320,15 +334,55 @@ def generate_token(length: int) -> str:
     return secrets.token_urlsafe(length)
 
 
-def generate_uuid(unique_str: str) -> str:
+def utcnow() -> datetime:
     """
-    Generates a unique identifier (UUID).
+    Returns the current UTC time as a naive datetime, the form every
+    timestamp column is stored in. Replaces `datetime.utcnow()`,
+    deprecated since Python 3.12.
     """
-    encoded_str = base64.urlsafe_b64encode(unique_str.encode("utf-8")).decode("utf-8")
-    random_num = random.randint(1111, 9999)
-    timestamp = math.floor(time.time())
-    uuid = f"{encoded_str}{random_num}{timestamp}"
-    return uuid
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def generate_uuid(unique_str: str = None) -> str:  # pylint: disable=W0613
+    """
+    Generates a unique identifier (UUID), a random 32 character hex string.
+    `unique_str` is accepted for the existing callers but no longer used,
+    the uid does not depend on it.
+    """
+    return uuid.uuid4().hex
+
+
+def verify_google_token(gtoken: dict) -> bool:
+    """
+    Checks whether an authorized-user Google token is valid.
+    Only the result is cached: the hash of a valid token maps to its expiry,
+    so the same token is not rebuilt into credentials on every request.
+    The token is never refreshed here and no credentials are kept.
+    """
+    # Cheap structural check first, malformed tokens never reach google-auth
+    if not all(isinstance(gtoken.get(field), str) for field in GOOGLE_TOKEN_KEYS):
+        return False
+
+    key = hashlib.sha256(
+        orjson.dumps(gtoken, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+    with GOOGLE_TOKEN_LOCK:
+        expiry = GOOGLE_TOKEN_CACHE.get(key)
+    if expiry and expiry > utcnow():
+        return True
+
+    try:
+        creds = Credentials.from_authorized_user_info(gtoken)
+    except ValueError:
+        return False
+
+    if creds.expired or not creds.token:
+        return False
+
+    if creds.expiry:
+        with GOOGLE_TOKEN_LOCK:
+            GOOGLE_TOKEN_CACHE[key] = creds.expiry
+    return True
 
 
 def send_mail(recipient_email: str, subject: str, message: str):
@@ -508,17 +562,15 @@ async def upload_to_drive(file: UploadFile, creds: Credentials, folder_id):
         service = build("drive", "v3", credentials=creds)
 
         # pylint: disable=E1101
-        created_file = (
-            service.files()
-            .create(
-                body={
-                    "name": f"{math.floor(time.time())}_{file.filename}",
-                    "parents": [folder_id],
-                },
-                media_body=media,
-            )
-            .execute()
+        request = service.files().create(
+            body={
+                "name": f"{math.floor(time.time())}_{file.filename}",
+                "parents": [folder_id],
+            },
+            media_body=media,
         )
+        # The upload blocks, so it runs in the threadpool instead of the event loop
+        created_file = await run_in_threadpool(request.execute)
 
     except HttpError as error:
         CustomValidations.raize_custom_error(
@@ -571,6 +623,12 @@ ALLOWED_FILE_EXTENSIONS = {
 # Define maximu file size
 MAX_FILE_SIZE_BYTES = 5 * 1024 * 1024  # 5 MB
 
+# Google tokens already verified, mapped to their expiry
+GOOGLE_TOKEN_CACHE = TTLCache(maxsize=1024, ttl=3600)
+# Keys an authorized-user token must carry to build credentials from it
+GOOGLE_TOKEN_KEYS = ("refresh_token", "client_id", "client_secret")
+GOOGLE_TOKEN_LOCK = threading.Lock()
+
 predefined_backend_permissions = [
     {"permission": "Can create user", "type": 1, "codename": "create_user"},
     {"permission": "Can read user", "type": 1, "codename": "read_user"},
@@ -44,7 +44,7 @@ def register_user(
     """
     # Check if a user with the same email or username already exists
     existing_user = (
-        sql.query(model.FrontendUser)
+        sql.query(model.FrontendUser.username, model.FrontendUser.email)
         .filter(
             (model.FrontendUser.email == data.email)
             | (model.FrontendUser.username == data.username)
@@ -94,7 +94,9 @@ def register_user(
 
     if data.timezone:
         # Check if the provided timezone exists in the database
-        exist_timezone = sql.query(model.Timezone).filter_by(code=data.timezone).first()
+        exist_timezone = sql.query(
+            sql.query(model.Timezone).filter_by(code=data.timezone).exists()
+        ).scalar()
         if not exist_timezone:
             CustomValidations.raize_custom_error(
                 error_type="not_exist",
@@ -442,14 +444,14 @@ def update_profile(
     """
     user = auth_token.user
     if request.username:
-        existing_user = (
+        existing_user = sql.query(
             sql.query(model.FrontendUser)
             .filter(
                 model.FrontendUser.username == request.username,
                 model.FrontendUser.id != user.id,
             )
-            .first()
-        )
+            .exists()
+        ).scalar()
         if existing_user:
             CustomValidations.raize_custom_error(
                 error_type="exist",
@@ -461,9 +463,9 @@ def update_profile(
         user.username = request.username
 
     if request.timezone:
-        exist_timezone = (
-            sql.query(model.Timezone).filter_by(code=request.timezone).first()
-        )
+        exist_timezone = sql.query(
+            sql.query(model.Timezone).filter_by(code=request.timezone).exists()
+        ).scalar()
         if not exist_timezone:
             CustomValidations.raize_custom_error(
                 error_type="not_exist",
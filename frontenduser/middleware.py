@@ -4,19 +4,33 @@ frontenduser/middleware.py
 Author: Gourav Sahu
 Date: 23/09/2023
 """
-from datetime import datetime
 from typing import Annotated
 
 from fastapi import Depends, Header, status
-from sqlalchemy.orm import Session
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.orm import Session, joinedload
 
 from database import get_db
-from dependencies import CustomValidations
+from dependencies import CustomValidations, utcnow
 
 from .model import FrontendToken
 
 
-async def authenticate_token(
+def get_token(sql: Session, authtoken: str):
+    """
+    Returns the login token row for `authtoken` with its user, or None.
+    Runs on every authenticated request, so the statement is a cached lambda.
+    """
+    return sql.scalars(
+        lambda_stmt(
+            lambda: select(FrontendToken)
+            .where(FrontendToken.token == authtoken)
+            .options(joinedload(FrontendToken.user))
+        )
+    ).first()
+
+
+def authenticate_token(
     authtoken: Annotated[
         str,
         Header(
@@ -38,7 +52,7 @@ async def authenticate_token(
     Raises:
         HTTPException: If the token is invalid or expired.
     """
-    user_token = sql.query(FrontendToken).filter_by(token=authtoken).first()
+    user_token = get_token(sql, authtoken)
 
     if (
         not user_token
@@ -55,7 +69,7 @@ async def authenticate_token(
             ctx={"authtoken": "valid"},
         )
 
-    if datetime.now() > user_token.expire_at:
+    if utcnow() > user_token.expire_at:
         CustomValidations.raize_custom_error(
             status_code=status.HTTP_401_UNAUTHORIZED,
             error_type="expired",
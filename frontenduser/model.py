@@ -238,20 +238,6 @@ class Transaction(Base):
             ")"
         )
 
-    def __str__(self):
-        """String representation of object"""
-        return (
-            "Transaction("
-            f"id={self.id}, "
-            f"order_id={self.order_id}, "
-            f"status='{self.status}', "
-            f"payment_gateway='{self.payment_gateway}', "
-            f"payment_id='{self.payment_id}', "
-            f"created_at='{self.created_at}', "
-            f"updated_at='{self.updated_at}'"
-            ")"
-        )
-
 
 class OrderProduct(Base):
     """
@@ -282,16 +268,3 @@ class OrderProduct(Base):
             f"quantity={self.quantity}"
             ")"
         )
-
-    def __str__(self):
-        """String representation of object"""
-        return (
-            "OrderProduct("
-            f"id={self.id}, "
-            f"product_price={self.product_price}, "
-            f"product_sale_price={self.product_sale_price}, "
-            f"order_id={self.order_id}, "
-            f"product_id={self.product_id}, "
-            f"quantity={self.quantity}"
-            ")"
-        )
@@ -4,28 +4,79 @@ organization/controller.py
 Author: Gourav Sahu
 Date: 23/09/2023
 """
-import json
-
 from fastapi import status
-from google.oauth2.credentials import Credentials
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, exists, func, insert, lambda_stmt, select
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from backenduser import model as backendModel
-from dependencies import CustomValidations, generate_uuid
+from database import insert_or_ignore, load_options, paginate, update_returning
+from dependencies import CustomValidations, verify_google_token
 from frontenduser import model as frontendModel
 
 from . import model, schema
+from .middleware import clear_permission_codenames, get_org_user
 
 
-def all_organizations(limit: int, offset: int, sql: Session):
+def all_organizations(limit: int, offset: int, sql: Session, cursor: str = None):
     """
     Retrieves a specified number of organizations from the database,
     along with the total count of organizations.
     """
-    count = sql.query(model.Organization).count()
-    organizations = sql.query(model.Organization).limit(limit).offset(offset).all()
+    # Active members of every organization, aggregated once for the whole page
+    user_counts = (
+        sql.query(
+            model.OrganizationUser.org_id,
+            func.count(model.OrganizationUser.id).label("total_users"),
+        )
+        .filter_by(is_active=True, is_deleted=False)
+        .group_by(model.OrganizationUser.org_id)
+        .cte("org_user_counts")
+    )
+    # Only the listed columns are fetched, no ORM instances are built for the page
+    query = (
+        sql.query(
+            model.Organization.id,
+            model.Organization.orguid,
+            model.Organization.org_name,
+            model.Organization.registration_type,
+            model.Organization.is_active,
+            model.Organization.is_deleted,
+            model.Organization.created_at,
+            model.Organization.updated_at,
+            frontendModel.FrontendUser.uuid.label("admin_uuid"),
+            frontendModel.FrontendUser.username.label("admin_username"),
+            frontendModel.FrontendUser.email.label("admin_email"),
+            func.coalesce(user_counts.c.total_users, 0).label("total_users"),
+        )
+        .outerjoin(
+            frontendModel.FrontendUser,
+            frontendModel.FrontendUser.id == model.Organization.admin_id,
+        )
+        .outerjoin(user_counts, user_counts.c.org_id == model.Organization.id)
+    )
+    rows, count, next_cursor = paginate(
+        query, model.Organization.id, limit, offset, cursor
+    )
+    organizations = [
+        {
+            "orguid": row.orguid,
+            "org_name": row.org_name,
+            "admin": {
+                "uuid": row.admin_uuid,
+                "username": row.admin_username,
+                "email": row.admin_email,
+            },
+            "registration_type": row.registration_type,
+            "is_active": row.is_active,
+            "is_deleted": row.is_deleted,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "total_users": row.total_users,
+        }
+        for row in rows
+    ]
 
-    return {"total": count, "organizations": organizations}
+    return {"total": count, "organizations": organizations, "next_cursor": next_cursor}
 
 
 def create_organization(
@@ -39,11 +90,36 @@ def create_organization(
     performing several validations before saving the organization.
     """
 
+    # Check if the registration type provided is allowed.
+    if data.registration_type not in model.Organization.allowed_registration:
+        CustomValidations.raize_custom_error(
+            error_type="invalid",
+            loc="registration_type",
+            msg="Allowed values are "
+            + ", ".join(sorted(model.Organization.allowed_registration)),
+            inp=data.registration_type,
+            ctx={"registration_type": "valid"},
+        )
+
+    # Check if the Google token provided is valid, before touching the database.
+    if not verify_google_token(data.gtoken):
+        CustomValidations.raize_custom_error(
+            error_type="Invalid",
+            loc="gtoken",
+            msg="Not a valid Google token.",
+            inp=str(data.gtoken),
+            ctx={"gtoken": "valid"},
+        )
+
     # Number of organizations can subscription allows.
     org_quantity = subscription.quantity
 
+    # Counting stops at the quota, only reaching it matters.
     total_organizations = (
-        sql.query(model.Organization.id).filter_by(admin_id=auth_token.id).count()
+        sql.query(model.Organization.id)
+        .filter_by(admin_id=auth_token.user_id)
+        .limit(org_quantity)
+        .count()
     )
 
     if total_organizations >= org_quantity:
@@ -55,11 +131,19 @@ def create_organization(
             ctx={"organization": "limited_creation"},
         )
 
-    # Check if the organization name already exists in the database.
-    existing_name = (
-        sql.query(model.Organization).filter_by(org_name=data.org_name).first()
+    # Insert unless the organization name already exists.
+    organization = insert_or_ignore(
+        sql,
+        model.Organization,
+        {
+            "org_name": data.org_name,
+            "admin_id": auth_token.user_id,
+            "gtoken": data.gtoken,
+            "registration_type": data.registration_type,
+        },
+        ["org_name"],
     )
-    if existing_name:
+    if not organization:
         CustomValidations.raize_custom_error(
             error_type="existing",
             loc="org_name",
@@ -68,49 +152,15 @@ def create_organization(
             ctx={"org_name": "unique"},
         )
 
-    # Check if the registration type provided is allowed.
-    if data.registration_type not in model.Organization.allowed_registration:
-        CustomValidations.raize_custom_error(
-            error_type="invalid",
-            loc="registration_type",
-            msg=f"Allowed values are {model.Organization.allowed_registration}",
-            inp=data.registration_type,
-            ctx={"registration_type": "valid"},
-        )
-
-    # Create an instance of OAuth 2.0 credentials using the dictionary
-    creds = Credentials.from_authorized_user_info(data.gtoken)
-
-    # Check if the Google token provided is valid.
-    if not creds or not creds.valid:
-        CustomValidations.raize_custom_error(
-            error_type="Invalid",
-            loc="gtoken",
-            msg="Not a valid Google token.",
-            inp=str(data.gtoken),
-            ctx={"gtoken": "valid"},
+    # Create default role in the same transaction as the organization,
+    # nothing reads it back so a Core insert is enough
+    sql.execute(
+        insert(model.OrganizationRole).values(
+            role="Default",
+            created_by=auth_token.user_id,
+            org_id=organization.id,
         )
-
-    organization = model.Organization(
-        orguid=generate_uuid(data.org_name),
-        org_name=data.org_name,
-        admin_id=auth_token.user_id,
-        gtoken=json.dumps(data.gtoken),
-        registration_type=data.registration_type,
     )
-
-    sql.add(organization)
-    sql.commit()
-    sql.refresh(organization)
-
-    # Create default role
-    org_role = model.OrganizationRole(
-        ruid=generate_uuid(data.org_name + "Default"),
-        role="Default",
-        created_by=auth_token.user_id,
-        org_id=organization.id,
-    )
-    sql.add(org_role)
     sql.commit()
 
     return organization
@@ -123,7 +173,54 @@ def register_to_organization(
     Registers a user to an organization.
     """
     user = auth_token.user
-    organization = sql.query(model.Organization).filter_by(orguid=data.org_uid).first()
+
+    # Number of members the admin's plan allows
+    user_quantity = (
+        select(backendModel.SubscriptionFeature.quantity)
+        .join(
+            backendModel.Feature,
+            backendModel.Feature.id == backendModel.SubscriptionFeature.feature_id,
+        )
+        .where(
+            backendModel.Feature.feature_code == "add_member",
+            backendModel.SubscriptionFeature.subscription_id
+            == frontendModel.FrontendUser.active_plan,
+        )
+        .limit(1)
+        .scalar_subquery()
+    )
+    # Active members of the organization
+    total_users = (
+        select(func.count(model.OrganizationUser.id))
+        .where(
+            # pylint: disable=singleton-comparison
+            model.OrganizationUser.org_id == model.Organization.id,
+            model.OrganizationUser.is_active == True,
+            model.OrganizationUser.is_deleted == False,
+        )
+        .scalar_subquery()
+    )
+    already_registered = exists().where(
+        model.OrganizationUser.org_id == model.Organization.id,
+        model.OrganizationUser.user_id == user.id,
+    )
+
+    # Everything the checks below need, in a single round-trip
+    organization = (
+        sql.query(
+            model.Organization.id,
+            model.Organization.registration_type,
+            func.coalesce(user_quantity, 0).label("user_quantity"),
+            total_users.label("total_users"),
+            already_registered.label("already_registered"),
+        )
+        .outerjoin(
+            frontendModel.FrontendUser,
+            frontendModel.FrontendUser.id == model.Organization.admin_id,
+        )
+        .filter(model.Organization.orguid == data.org_uid)
+        .first()
+    )
 
     if not organization:
         CustomValidations.raize_custom_error(
@@ -144,41 +241,16 @@ def register_to_organization(
             ctx={"registration": "admin_only"},
         )
 
-    admin = organization.admin
-    feature = (
-        sql.query(backendModel.Feature).filter_by(feature_code="add_member").first()
-    )
-
-    subscription_feature = (
-        sql.query(backendModel.SubscriptionFeature)
-        .filter_by(subscription_id=admin.active_plan, feature_id=feature.id)
-        .first()
-    )
-
-    user_quantity = subscription_feature.quantity
-
-    total_users = (
-        sql.query(model.OrganizationUser.id)
-        .filter_by(org_id=organization.id, is_deleted=False, is_active=True)
-        .count()
-    )
-
-    if total_users >= user_quantity:
+    if organization.total_users >= organization.user_quantity:
         CustomValidations.raize_custom_error(
             error_type="limit_exceed",
             loc="organization",
-            msg=f"Can not add more than '{user_quantity}' users.",
+            msg=f"Can not add more than '{organization.user_quantity}' users.",
             inp=data.org_uid,
             ctx={"organization": "limited_creation"},
         )
 
-    org_user = (
-        sql.query(model.OrganizationUser)
-        .filter_by(org_id=organization.id, user_id=user.id)
-        .first()
-    )
-
-    if org_user:
+    if organization.already_registered:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
             loc="organization",
@@ -196,39 +268,59 @@ def register_to_organization(
 
     sql.add(org_user)
     sql.commit()
-    sql.refresh(org_user)
+    clear_permission_codenames(organization.id, [user.id])
     return org_user
 
 
 def get_all_users(
-    limit: int, offset: int, organization: model.Organization, sql: Session
+    limit: int,
+    offset: int,
+    organization: model.Organization,
+    sql: Session,
+    cursor: str = None,
 ):
     """
     Retrieves a specified number of users belonging to a specific organization,
     along with the total count of users.
     """
-    users = (
+    # Everything ShowOrgUser serializes is loaded up front, no lazy load per user
+    query = (
         sql.query(model.OrganizationUser)
+        .options(
+            *load_options(
+                joinedload(model.OrganizationUser.user),
+                joinedload(model.OrganizationUser.role),
+                selectinload(model.OrganizationUser.permissions).joinedload(
+                    model.OrganizationRolePermission.permission
+                ),
+            )
+        )
         .filter_by(org_id=organization.id)
-        .limit(limit)
-        .offset(offset)
-        .all()
     )
-    count = (
-        sql.query(model.OrganizationUser.id).filter_by(org_id=organization.id).count()
+    users, count, next_cursor = paginate(
+        query, model.OrganizationUser.id, limit, offset, cursor
     )
-    print(count)
-    print(users)
 
-    return {"total": count, "users": users}
+    return {"total": count, "users": users, "next_cursor": next_cursor}
 
 
 def get_user_details(uuid: str, organization: model.Organization, sql: Session):
     """
     Retrieves the details of a user in an organization based on the user's UUID.
     """
-    user = sql.query(frontendModel.FrontendUser).filter_by(uuid=uuid).first()
-    if not user:
+    row = (
+        sql.query(frontendModel.FrontendUser.id, model.OrganizationUser)
+        .outerjoin(
+            model.OrganizationUser,
+            and_(
+                model.OrganizationUser.user_id == frontendModel.FrontendUser.id,
+                model.OrganizationUser.org_id == organization.id,
+            ),
+        )
+        .filter(frontendModel.FrontendUser.uuid == uuid)
+        .first()
+    )
+    if not row:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
             loc="user_id",
@@ -236,11 +328,8 @@ def get_user_details(uuid: str, organization: model.Organization, sql: Session):
             inp=uuid,
             ctx={"user": "exist"},
         )
-    org_user = (
-        sql.query(model.OrganizationUser)
-        .filter_by(user_id=user.id, org_id=organization.id)
-        .first()
-    )
+
+    org_user = row[1]
     if not org_user:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
@@ -254,33 +343,55 @@ def get_user_details(uuid: str, organization: model.Organization, sql: Session):
 
 
 def get_all_roles(
-    limit: int, offset: int, organization: model.Organization, sql: Session
+    limit: int,
+    offset: int,
+    organization: model.Organization,
+    sql: Session,
+    cursor: str = None,
 ):
     """
     Retrieves a specified number of roles belonging to a specific organization,
     along with the total count of roles.
     """
-    roles = (
+    # Everything ShowOrgRole serializes is loaded up front, no lazy load per role
+    query = (
         sql.query(model.OrganizationRole)
+        .options(
+            *load_options(
+                selectinload(model.OrganizationRole.permissions).joinedload(
+                    model.OrganizationRolePermission.permission
+                ),
+            )
+        )
         .filter_by(org_id=organization.id)
-        .limit(limit)
-        .offset(offset)
-        .all()
     )
-    count = sql.query(model.OrganizationRole).filter_by(org_id=organization.id).count()
+    roles, count, next_cursor = paginate(
+        query, model.OrganizationRole.id, limit, offset, cursor
+    )
 
-    return {"total": count, "roles": roles}
+    return {"total": count, "roles": roles, "next_cursor": next_cursor}
+
+
+def get_role(sql: Session, ruid: str, org_id: int):
+    """
+    Returns the role with `ruid` in the organization `org_id`, or None.
+    The lookup statement is a cached lambda, it is built only once.
+    """
+    return sql.scalars(
+        lambda_stmt(
+            lambda: select(model.OrganizationRole).where(
+                model.OrganizationRole.ruid == ruid,
+                model.OrganizationRole.org_id == org_id,
+            )
+        )
+    ).first()
 
 
 def get_role_details(role_id: str, organization: model.Organization, sql: Session):
     """
     Retrieves the details of a role in an organization based on the role's UUID.
     """
-    role = (
-        sql.query(model.OrganizationRole)
-        .filter_by(ruid=role_id, org_id=organization.id)
-        .first()
-    )
+    role = get_role(sql, role_id, organization.id)
     if not role:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
@@ -300,6 +411,58 @@ def get_all_permissions(sql: Session):
     return sql.query(model.OrganizationPermission).all()
 
 
+def add_permissions(sql: Session, owner: str, owner_id: int, codenames: list[str]):
+    """
+    Links the permissions matching `codenames` to a role or an organization user
+    (`owner` is "role_id" or "user_id"), ids come from the cached catalog.
+    """
+    permission_ids = model.org_permission_ids(sql.get_bind())
+    rows = [
+        {owner: owner_id, "permission_id": permission_ids[codename]}
+        for codename in dict.fromkeys(codenames)
+        if codename in permission_ids
+    ]
+    if rows:
+        sql.execute(insert(model.OrganizationRolePermission), rows)
+
+
+def replace_permissions(sql: Session, owner: str, owner_id: int, codenames: list[str]):
+    """
+    Makes the permissions of a role or an organization user match `codenames`,
+    only the links that changed are deleted or inserted.
+    """
+    permission_ids = model.org_permission_ids(sql.get_bind())
+    wanted = {
+        permission_ids[codename]
+        for codename in codenames
+        if codename in permission_ids
+    }
+    owner_column = getattr(model.OrganizationRolePermission, owner)
+    existing = set(
+        sql.scalars(
+            select(model.OrganizationRolePermission.permission_id).where(
+                owner_column == owner_id
+            )
+        )
+    )
+
+    if existing - wanted:
+        sql.execute(
+            delete(model.OrganizationRolePermission).where(
+                owner_column == owner_id,
+                model.OrganizationRolePermission.permission_id.in_(existing - wanted),
+            )
+        )
+    if wanted - existing:
+        sql.execute(
+            insert(model.OrganizationRolePermission),
+            [
+                {owner: owner_id, "permission_id": permission_id}
+                for permission_id in sorted(wanted - existing)
+            ],
+        )
+
+
 def create_role(
     data: schema.CreateRole,
     organization: model.Organization,
@@ -310,13 +473,18 @@ def create_role(
     Creates a new role for an organization in the database,
     performing validations to ensure the role does not already exist.
     """
-    # Check if a role with the same name already exists in the organization
-    role = (
-        sql.query(model.OrganizationRole)
-        .filter_by(role=data.role, org_id=organization.id)
-        .first()
+    # Create the role unless one with the same name exists in the organization
+    new_role = insert_or_ignore(
+        sql,
+        model.OrganizationRole,
+        {
+            "role": data.role,
+            "org_id": organization.id,
+            "created_by": authtoken.user_id,
+        },
+        ["role", "org_id"],
     )
-    if role:
+    if not new_role:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
             loc="role",
@@ -325,33 +493,8 @@ def create_role(
             ctx={"role": "unique"},
         )
 
-    # Create a new role object
-    new_role = model.OrganizationRole(
-        ruid=generate_uuid(data.role),
-        role=data.role,
-        org_id=organization.id,
-        created_by=authtoken.user_id,
-    )
-    sql.add(new_role)
-    sql.commit()
-    sql.refresh(new_role)
-
-    # Retrieve the permissions associated with the role from the input data
-    codenames = data.permissions
-    permissions = (
-        sql.query(model.OrganizationPermission)
-        .filter(model.OrganizationPermission.codename.in_(codenames))
-        .all()
-    )
-
-    # Create role_permission objects and add them to the database
-    role_permissions = [
-        model.OrganizationRolePermission(
-            role_id=new_role.id, permission_id=permission.id
-        )
-        for permission in permissions
-    ]
-    sql.add_all(role_permissions)
+    # Link the requested permissions to the role, committed together with it
+    add_permissions(sql, "role_id", new_role.id, data.permissions)
     sql.commit()
 
     return new_role
@@ -363,28 +506,12 @@ def update_role(
     """
     Updates the role of an organization.
     """
-    role = (
-        sql.query(model.OrganizationRole)
-        .filter_by(ruid=data.ruid, org_id=organization.id)
-        .first()
-    )
-
-    # If the role does not exist, raise a custom error
-    if not role:
-        CustomValidations.raize_custom_error(
-            error_type="not_exist",
-            loc="role",
-            msg="Role does not exist",
-            inp=data.ruid,
-            ctx={"ruid": "exist"},
-        )
-
     # Check if there is already a role with the same name in the organization.
-    exit_role = (
+    exit_role = sql.query(
         sql.query(model.OrganizationRole)
         .filter_by(role=data.role, org_id=organization.id)
-        .first()
-    )
+        .exists()
+    ).scalar()
     if exit_role:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
@@ -394,31 +521,52 @@ def update_role(
             ctx={"role": "unique"},
         )
 
-    if data.role:
-        role.role = data.role
+    # Only the fields the client actually sent are written, the lookup and
+    # the write are a single UPDATE ... RETURNING
+    patch = data.model_dump(
+        exclude_unset=True, exclude_none=True, exclude={"ruid", "permissions"}
+    )
+    if patch:
+        role = update_returning(
+            sql,
+            model.OrganizationRole,
+            (
+                model.OrganizationRole.ruid == data.ruid,
+                model.OrganizationRole.org_id == organization.id,
+            ),
+            patch,
+        )
+    else:
+        role = get_role(sql, data.ruid, organization.id)
+
+    # If the role does not exist, raise a custom error
+    if not role:
+        CustomValidations.raize_custom_error(
+            error_type="not_exist",
+            loc="role",
+            msg="Role does not exist",
+            inp=data.ruid,
+            ctx={"ruid": "exist"},
+        )
 
     if data.permissions:
-        # Delete existing permissions for the role from the database
-        sql.query(model.OrganizationRolePermission).filter_by(role_id=role.id).delete()
+        # Only the permissions that changed are written
+        replace_permissions(sql, "role_id", role.id, data.permissions)
+    sql.commit()
 
-        # Retrieve the permissions associated with the provided permission codenames
-        codenames = data.permissions
-        permissions = (
-            sql.query(model.OrganizationPermission)
-            .filter(model.OrganizationPermission.codename.in_(codenames))
-            .all()
+    if data.permissions:
+        # Every member holding the role has to read its new permissions
+        clear_permission_codenames(
+            organization.id,
+            sql.scalars(
+                select(model.OrganizationUser.user_id).where(
+                    model.OrganizationUser.role_id == role.id
+                )
+            ),
         )
 
-        # Assign new permissions to the role
-        role_permissions = [
-            model.OrganizationRolePermission(
-                role_id=role.id, permission_id=permission.id
-            )
-            for permission in permissions
-        ]
-        sql.add_all(role_permissions)
-    sql.commit()
-    sql.refresh(role)
+    # Only the permissions were replaced behind the ORM, reload just them
+    sql.expire(role, ["permissions"])
 
     return role
 
@@ -431,11 +579,7 @@ def assign_role(
     """
 
     # Get role with the specified role ID which belong to the given organization
-    role = (
-        sql.query(model.OrganizationRole)
-        .filter_by(ruid=data.role_id, org_id=organization.id)
-        .first()
-    )
+    role = get_role(sql, data.role_id, organization.id)
     if not role:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
@@ -445,9 +589,20 @@ def assign_role(
             ctx={"ruid": "exist"},
         )
 
-    # Find the user with the specified user ID
-    user = sql.query(frontendModel.FrontendUser).filter_by(uuid=data.user_id).first()
-    if not user:
+    # Find the user with the specified user ID with its organization user entry
+    row = (
+        sql.query(frontendModel.FrontendUser.id, model.OrganizationUser)
+        .outerjoin(
+            model.OrganizationUser,
+            and_(
+                model.OrganizationUser.user_id == frontendModel.FrontendUser.id,
+                model.OrganizationUser.org_id == organization.id,
+            ),
+        )
+        .filter(frontendModel.FrontendUser.uuid == data.user_id)
+        .first()
+    )
+    if not row:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
             loc="role",
@@ -456,12 +611,7 @@ def assign_role(
             ctx={"ruid": "exist"},
         )
 
-    # Find the organization user entry for the user and organization
-    org_user = (
-        sql.query(model.OrganizationUser)
-        .filter_by(user_id=user.id, org_id=organization.id)
-        .first()
-    )
+    org_user = row[1]
     if not org_user:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
@@ -471,13 +621,12 @@ def assign_role(
             ctx={"ruid": "exist"},
         )
 
-    # Update the role ID of the organization user entry
-    org_user.role_id = role.id
+    # Update the role of the organization user entry
+    org_user.role = role
 
     # Commit the changes to the database
     sql.commit()
-    # Refresh the organization user entry
-    sql.refresh(org_user)
+    clear_permission_codenames(organization.id, [org_user.user_id])
 
     return org_user
 
@@ -500,11 +649,7 @@ def assign_user_permission(
         )
 
     # Get organization user object based on the user ID and organization ID
-    org_user = (
-        sql.query(model.OrganizationUser)
-        .filter_by(user_id=user.id, org_id=organization.id)
-        .first()
-    )
+    org_user = get_org_user(sql, user.id, organization.id)
     if not org_user:
         CustomValidations.raize_custom_error(
             error_type="not_exist",
@@ -514,28 +659,10 @@ def assign_user_permission(
             ctx={"uuid": "exist"},
         )
 
-    # Delete any existing role permissions for the organization user
-    sql.query(model.OrganizationRolePermission).filter_by(user_id=org_user.id).delete()
-
-    # Retrieve the requested permissions from the database
-    codenames = data.permissions
-    permissions = (
-        sql.query(model.OrganizationPermission)
-        .filter(model.OrganizationPermission.codename.in_(codenames))
-        .all()
-    )
-
-    # Assign new permissions for the organization user
-    role_permissions = [
-        model.OrganizationRolePermission(
-            user_id=org_user.id, permission_id=permission.id
-        )
-        for permission in permissions
-    ]
-
-    # Add the new role permissions to the database
-    sql.add_all(role_permissions)
+    # Only the permissions of the organization user that changed are written
+    replace_permissions(sql, "user_id", org_user.id, data.permissions)
     sql.commit()
-    sql.refresh(org_user)
+    clear_permission_codenames(organization.id, [user.id])
+    sql.expire(org_user, ["permissions"])
 
     return org_user
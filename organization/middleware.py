@@ -5,19 +5,168 @@ Author: Gourav Sahu
 Date: 23/09/2023
 """
 from datetime import datetime
-from typing import Annotated
 
 from fastapi import Depends, Header, status
-from sqlalchemy.orm import Session
+from sqlalchemy import lambda_stmt, or_, select
+from sqlalchemy.orm import Session, defer
 
 from backenduser import model as backendModel
-from database import get_db
-from dependencies import CustomValidations
+from cache import cache_delete, cache_get, cache_set
+from database import get_db, load_options
+from dependencies import CustomValidations, utcnow
 from frontenduser import model as frontendModel
+from frontenduser.middleware import authenticate_token
 
 from . import model
 
 
+def get_organization(sql: Session, orguid: str):
+    """
+    Returns the organization with `orguid` and the active plan of its admin
+    as a row, or None.
+    The Google token is deferred, only the media upload reads it.
+    Runs on every organization request, so the statement is a cached lambda.
+    """
+    return sql.execute(
+        lambda_stmt(
+            lambda: select(model.Organization, frontendModel.FrontendUser.active_plan)
+            .outerjoin(
+                frontendModel.FrontendUser,
+                frontendModel.FrontendUser.id == model.Organization.admin_id,
+            )
+            .where(model.Organization.orguid == orguid)
+            .options(*load_options(defer(model.Organization.gtoken)))
+        )
+    ).first()
+
+
+def get_org_user(sql: Session, user_id: int, org_id: int):
+    """
+    Returns the membership of user `user_id` in organization `org_id`, or None.
+    Checked on every permission guarded request, so the statement is a cached lambda.
+    """
+    return sql.scalars(
+        lambda_stmt(
+            lambda: select(model.OrganizationUser).where(
+                model.OrganizationUser.user_id == user_id,
+                model.OrganizationUser.org_id == org_id,
+            )
+        )
+    ).first()
+
+
+def get_permission_codenames(sql: Session, user_id: int, org_id: int) -> set[str]:
+    """
+    Returns the permission codenames of user `user_id` in organization `org_id`,
+    granted through the member's role or directly to the member.
+    One query replaces walking the role and member permission relationships.
+    Every permission check reads it, so the codenames are cached in Redis;
+    `clear_permission_codenames` drops them when they change. Without Redis
+    they are read every time, other workers could not see a revocation.
+    """
+    cache_key = f"org_permissions:{org_id}:{user_id}"
+    codenames = cache_get(cache_key, shared_only=True)
+    if codenames is None:
+        codenames = list(
+            sql.scalars(
+                lambda_stmt(
+                    lambda: select(model.OrganizationPermission.codename)
+                    .join(
+                        model.OrganizationRolePermission,
+                        model.OrganizationRolePermission.permission_id
+                        == model.OrganizationPermission.id,
+                    )
+                    .join(
+                        model.OrganizationUser,
+                        or_(
+                            model.OrganizationRolePermission.role_id
+                            == model.OrganizationUser.role_id,
+                            model.OrganizationRolePermission.user_id
+                            == model.OrganizationUser.id,
+                        ),
+                    )
+                    .where(
+                        model.OrganizationUser.user_id == user_id,
+                        model.OrganizationUser.org_id == org_id,
+                    )
+                )
+            )
+        )
+        cache_set(cache_key, codenames, shared_only=True)
+    return set(codenames)
+
+
+def clear_permission_codenames(org_id: int, user_ids):
+    """
+    Drops the cached permission codenames of `user_ids` in organization `org_id`,
+    call it after their role or the permissions they are granted change.
+    """
+    for user_id in user_ids:
+        cache_delete(f"org_permissions:{org_id}:{user_id}")
+
+
+def get_subscription_expiry(sql: Session, user_id: int, plan_id: int):
+    """
+    Returns the expiry of the subscription of user `user_id` to plan `plan_id`,
+    the user's active plan, or None.
+    Checked on every organization request, so the expiry is cached per plan:
+    changing the active plan reads a new key, `create_subscription_user` clears it.
+    """
+    cache_key = f"subscription_expiry:{user_id}:{plan_id}"
+    expiry = cache_get(cache_key)
+    if expiry is None:
+        subscription_user = (
+            sql.query(backendModel.SubscriptionUser.expiry)
+            .filter(
+                backendModel.SubscriptionUser.user_id == user_id,
+                backendModel.SubscriptionUser.subscription_id == plan_id,
+            )
+            .order_by(backendModel.SubscriptionUser.expiry.desc())
+            .first()
+        )
+        if not subscription_user:
+            return None
+        expiry = subscription_user.expiry.isoformat()
+        cache_set(cache_key, expiry)
+
+    return datetime.fromisoformat(expiry)
+
+
+def get_plan_features(sql: Session, subscription_id: int) -> dict[str, dict]:
+    """
+    Returns the features of subscription plan `subscription_id` by feature code.
+    Plans rarely change, so the map is cached; `update_subscription_plan` clears it.
+    """
+    cache_key = f"plan_features:{subscription_id}"
+    features = cache_get(cache_key)
+    if features is None:
+        rows = (
+            sql.query(
+                backendModel.Feature.feature_code,
+                backendModel.SubscriptionFeature.id,
+                backendModel.SubscriptionFeature.feature_id,
+                backendModel.SubscriptionFeature.quantity,
+            )
+            .join(
+                backendModel.Feature,
+                backendModel.Feature.id == backendModel.SubscriptionFeature.feature_id,
+            )
+            .filter(backendModel.SubscriptionFeature.subscription_id == subscription_id)
+            .all()
+        )
+        features = {
+            row.feature_code: {
+                "id": row.id,
+                "feature_id": row.feature_id,
+                "quantity": row.quantity,
+            }
+            for row in rows
+        }
+        cache_set(cache_key, features)
+
+    return features
+
+
 def check_feature(feature_code: str):
     """
     Returns a dependency function `has_feature`
@@ -26,83 +175,52 @@ def check_feature(feature_code: str):
     """
 
     def has_feature(
-        authtoken: Annotated[
-            str,
-            Header(
-                title="Authentication token",
-                description="The token you get from login.",
-            ),
-        ],
+        user_token: frontendModel.FrontendToken = Depends(authenticate_token),
         sql: Session = Depends(get_db),
     ):
         """
         Function that checks if the user has the specified feature.
+        The token comes from `authenticate_token`, which the route already
+        depends on, so FastAPI resolves it once per request.
         """
-        user_token = (
-            sql.query(frontendModel.FrontendToken).filter_by(token=authtoken).first()
-        )
-
-        if not user_token or not user_token.user:
-            CustomValidations.raize_custom_error(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                error_type="expired",
-                loc="authtoken",
-                msg="Token is expired, try login again.",
-                inp=authtoken,
-                ctx={"authtoken": "valid"},
-            )
-
         if not user_token.user.active_plan:
             CustomValidations.raize_custom_error(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 error_type="unauthenticated",
                 loc="subscription",
                 msg="No active subscription.",
-                inp=authtoken,
+                inp=user_token.token,
                 ctx={"subscription": "not found"},
             )
 
-        subscription_user = (
-            sql.query(backendModel.SubscriptionUser)
-            .filter(
-                backendModel.SubscriptionUser.subscription_id
-                == user_token.user.active_plan,
-                backendModel.SubscriptionUser.user_id == user_token.user.id,
-            )
-            .first()
+        expiry = get_subscription_expiry(
+            sql, user_token.user_id, user_token.user.active_plan
         )
-
-        if not subscription_user or subscription_user.expiry <= datetime.utcnow():
+        if not expiry or expiry <= utcnow():
             CustomValidations.raize_custom_error(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 error_type="unauthenticated",
                 loc="subscription",
                 msg="No active subscription.",
-                inp=authtoken,
-                ctx={
-                    "subscription": "not found" if not subscription_user else "expired"
-                },
+                inp=user_token.token,
+                ctx={"subscription": "not found" if not expiry else "expired"},
             )
 
-        subscription_features = (
-            sql.query(backendModel.SubscriptionFeature)
-            .filter(
-                backendModel.SubscriptionFeature.subscription_id
-                == user_token.user.active_plan
-            )
-            .all()
+        feature = get_plan_features(sql, user_token.user.active_plan).get(
+            feature_code
         )
-
-        for feature in subscription_features:
-            if feature.feature.feature_code == feature_code:
-                return feature
+        if feature:
+            # Built from the cached row, it is never added to the session
+            return backendModel.SubscriptionFeature(
+                subscription_id=user_token.user.active_plan, **feature
+            )
 
         CustomValidations.raize_custom_error(
             status_code=status.HTTP_401_UNAUTHORIZED,
             error_type="unauthenticated",
             loc="feature",
             msg="feature not available.",
-            inp=authtoken,
+            inp=user_token.token,
             ctx={"feature": "not_available"},
         )
         return False
@@ -121,9 +239,10 @@ def organization_exist(
     Checks if an organization with the given orguid exists in the database
     and if the organization's admin has an active subscription.
     """
-    organization = sql.query(model.Organization).filter_by(orguid=orguid).first()
-    if not organization:
+    row = get_organization(sql, orguid)
+    if not row:
         CustomValidations.raize_custom_error(
+            status_code=status.HTTP_404_NOT_FOUND,
             error_type="not_exist",
             loc="org_uid",
             msg="Organization does not exist.",
@@ -131,25 +250,20 @@ def organization_exist(
             ctx={"org_uid": "exist"},
         )
 
-    admin = organization.admin
-
-    subscription_user = (
-        sql.query(backendModel.SubscriptionUser)
-        .filter(
-            backendModel.SubscriptionUser.subscription_id == admin.active_plan,
-            backendModel.SubscriptionUser.user_id == admin.id,
-        )
-        .first()
+    organization, active_plan = row
+    expiry = (
+        get_subscription_expiry(sql, organization.admin_id, active_plan)
+        if active_plan
+        else None
     )
-
-    if not subscription_user or subscription_user.expiry <= datetime.utcnow():
+    if not expiry or expiry <= utcnow():
         CustomValidations.raize_custom_error(
             status_code=status.HTTP_403_FORBIDDEN,
             error_type="unauthenticated",
             loc="subscription",
             msg="No active subscription.",
             inp=str(),
-            ctx={"subscription": "not found" if not subscription_user else "expired"},
+            ctx={"subscription": "not found" if not expiry else "expired"},
         )
 
     return organization
@@ -161,74 +275,28 @@ def check_permission(codenames: list[str]):
     that checks if a user has a specific permission
     based on their authentication token.
     """
+    # Built once per route, not on every request
+    required_codenames = frozenset(codenames)
 
     def has_permissions(
-        authtoken: Annotated[
-            str,
-            Header(
-                title="Authentication token",
-                description="The token you get from login.",
-            ),
-        ],
-        orguid: Annotated[
-            str,
-            Header(
-                title="Organization id",
-                description="orguid of the organization you are accessing.",
-            ),
-        ],
+        organization: model.Organization = Depends(organization_exist),
+        user_token: frontendModel.FrontendToken = Depends(authenticate_token),
         sql: Session = Depends(get_db),
     ):
         """
         Check if a user has the required permissions
         to access a specific organization.
+        The organization and the token come from the dependencies the routes
+        already use, FastAPI resolves each of them once per request.
         """
-        organization = sql.query(model.Organization).filter_by(orguid=orguid).first()
-
-        if not organization:
-            CustomValidations.raize_custom_error(
-                error_type="not_exist",
-                loc="org_uid",
-                msg="Organization does not exist.",
-                inp=str(orguid),
-                ctx={"org_uid": "exist"},
-            )
-
-        user_token = (
-            sql.query(frontendModel.FrontendToken).filter_by(token=authtoken).first()
-        )
-
-        if not user_token or not user_token.user:
-            CustomValidations.raize_custom_error(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                error_type="expired",
-                loc="authtoken",
-                msg="Token is expired, try login again.",
-                inp=authtoken,
-                ctx={"authtoken": "valid"},
-            )
-
-        if user_token.user.id == organization.admin_id:
+        if user_token.user_id == organization.admin_id:
             return "__all__"
 
-        org_user = (
-            sql.query(model.OrganizationUser)
-            .filter(
-                model.OrganizationUser.user_id == user_token.user_id,
-                model.OrganizationUser.org_id == organization.id,
-            )
-            .first()
+        user_permission_codenames = get_permission_codenames(
+            sql, user_token.user_id, organization.id
         )
-        role_permissions = org_user.role.permissions
-        user_permission_codenames = [
-            item.permission.codename for item in role_permissions
-        ]
-
-        user_permissions = org_user.permissions
-        for item in user_permissions:
-            user_permission_codenames.append(item.permission.codename)
 
-        if not all(codename in user_permission_codenames for codename in codenames):
+        if not required_codenames <= user_permission_codenames:
             CustomValidations.raize_custom_error(
                 status_code=status.HTTP_403_FORBIDDEN,
                 error_type="unauthenticated",
@@ -238,6 +306,6 @@ def check_permission(codenames: list[str]):
                 ctx={"permission": ", ".join(codenames)},
             )
 
-        return user_permission_codenames
+        return list(user_permission_codenames)
 
     return has_permissions
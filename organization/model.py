@@ -4,12 +4,24 @@ organization/model.py
 Author: Gourav Sahu
 Date: 23/09/2023
 """
-from datetime import datetime
-
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text, exc
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    exc,
+    insert,
+    select,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
-from database import Base, SessionLocal
+from database import Base, SessionLocal, random_uid, utc_timestamp
 from dependencies import predefined_organization_permissions
 
 
@@ -19,12 +31,16 @@ class Organization(Base):
     """
 
     __tablename__ = "organizations"
+    # Read back the database timestamps with the INSERT / UPDATE itself
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    orguid = Column(String(50), index=True, unique=True)
-    org_name = Column(String(50), nullable=False)
-    admin_id = Column(Integer, ForeignKey("frontendusers.id"))
-    gtoken = Column(Text, nullable=True)
+    orguid = Column(
+        String(50), index=True, unique=True, nullable=False, server_default=random_uid()
+    )
+    org_name = Column(String(50), nullable=False, unique=True)
+    admin_id = Column(Integer, ForeignKey("frontendusers.id"), index=True)
+    gtoken = Column(JSON().with_variant(JSONB, "postgresql"), nullable=True)
     registration_type = Column(
         String(20),
         default=1,
@@ -32,11 +48,13 @@ class Organization(Base):
     )
     is_active = Column(Boolean, default=True)
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(
+        DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp()
+    )
 
     admin = relationship("FrontendUser", foreign_keys=admin_id)
-    allowed_registration = ["open", "approval_required", "admin_only"]
+    allowed_registration = frozenset(("open", "approval_required", "admin_only"))
 
     def __repr__(self):
         return (
@@ -57,6 +75,13 @@ class OrganizationUser(Base):
     """
 
     __tablename__ = "organization_users"
+    __table_args__ = (
+        # Active members of an organization, used by the member limit and lists
+        Index("ix_orguser_org_active", "org_id", "is_active", "is_deleted"),
+        UniqueConstraint("user_id", "org_id"),
+    )
+    # Read back the database timestamps with the INSERT / UPDATE itself
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("frontendusers.id"))
@@ -64,8 +89,10 @@ class OrganizationUser(Base):
     role_id = Column(Integer, ForeignKey("organization_roles.id"))
     is_active = Column(Boolean, default=True)
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(
+        DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp()
+    )
 
     user = relationship("FrontendUser", foreign_keys=user_id)
     Organization = relationship("Organization", foreign_keys=org_id)
@@ -84,18 +111,6 @@ class OrganizationUser(Base):
             ")"
         )
 
-    def __str__(self):
-        return (
-            "OrganizationUser("
-            f"id={self.id}, "
-            f"user_id={self.user_id}, "
-            f"org_id={self.org_id}, "
-            f"role_id={self.role_id}, "
-            f"created_at={self.created_at}, "
-            f"updated_at={self.updated_at}"
-            ")"
-        )
-
 
 class OrganizationRole(Base):
     """
@@ -103,15 +118,22 @@ class OrganizationRole(Base):
     """
 
     __tablename__ = "organization_roles"
+    __table_args__ = (UniqueConstraint("role", "org_id"),)
+    # Read back the database timestamps with the INSERT / UPDATE itself
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    ruid = Column(String(50), index=True, unique=True)
+    ruid = Column(
+        String(50), index=True, unique=True, nullable=False, server_default=random_uid()
+    )
     role = Column(String(50))
     created_by = Column(Integer, ForeignKey("frontendusers.id"))
-    org_id = Column(Integer, ForeignKey("organizations.id"))
+    org_id = Column(Integer, ForeignKey("organizations.id"), index=True)
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(
+        DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp()
+    )
 
     permissions = relationship("OrganizationRolePermission", back_populates="role")
 
@@ -148,6 +170,25 @@ class OrganizationPermission(Base):
         return f"Organization Permission: {self.permission}"
 
 
+# Codename -> id of the organization permissions, see `org_permission_ids`
+ORG_PERMISSION_IDS: dict[str, int] = {}
+
+
+def org_permission_ids(bind) -> dict[str, int]:
+    """
+    Returns the organization permission ids by codename.
+    The catalog only changes when it is seeded, so it is read once and kept;
+    an empty catalog is not kept, it is read again until the seed has run.
+    """
+    if not ORG_PERMISSION_IDS:
+        with bind.connect() as connection:
+            rows = connection.execute(
+                select(OrganizationPermission.codename, OrganizationPermission.id)
+            )
+            ORG_PERMISSION_IDS.update(rows.all())
+    return ORG_PERMISSION_IDS
+
+
 def create_org_permissions():
     """
     Create predefined organization permissions in the database.
@@ -155,12 +196,11 @@ def create_org_permissions():
     try:
         print("Creating organization permissions data...")
         sql = SessionLocal()
-        permissions = [
-            OrganizationPermission(**permission)
-            for permission in predefined_organization_permissions
-        ]
-        sql.add_all(permissions)
+        sql.execute(
+            insert(OrganizationPermission), predefined_organization_permissions
+        )
         sql.commit()
+        ORG_PERMISSION_IDS.clear()
         return {"message": "Organization Permissions created successfully"}
     except exc.IntegrityError as error:
         sql.rollback()
@@ -178,6 +218,11 @@ class OrganizationRolePermission(Base):
     """
 
     __tablename__ = "organization_rolepermissions"
+    __table_args__ = (
+        # One link per permission, they also serve the lookups by role or member
+        UniqueConstraint("role_id", "permission_id"),
+        UniqueConstraint("user_id", "permission_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     role_id = Column(Integer, ForeignKey("organization_roles.id"), nullable=True)
@@ -202,12 +247,3 @@ class OrganizationRolePermission(Base):
             f"permission_id={self.permission_id}"
             ")>"
         )
-
-    def __str__(self):
-        return (
-            "<OrganizationRolePermission("
-            f"id={self.id}, "
-            f"role_id={self.role_id}, "
-            f"permission_id={self.permission_id}"
-            ")>"
-        )
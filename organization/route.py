@@ -4,6 +4,8 @@ organization/route.py
 Author: Gourav Sahu
 Date: 23/09/2023
 """
+from typing import Optional
+
 from fastapi import APIRouter, Depends, Path, Query, status
 from sqlalchemy.orm import Session
 
@@ -29,13 +31,16 @@ organizationRoutes = APIRouter()
 def get_all_organizations(
     limit: int = Query(10, ge=1, le=100, description="number of results to retrieve"),
     offset: int = Query(0, ge=0, description="Number of results to skip."),
+    cursor: Optional[str] = Query(
+        None, description="`next_cursor` of the previous page, used instead of offset."
+    ),
     sql: Session = Depends(get_db),
 ):
     """
     Retrieves a specified number of organizations from the database,
     along with the total count of organizations.
     """
-    return controller.all_organizations(limit, offset, sql)
+    return controller.all_organizations(limit, offset, sql, cursor)
 
 
 @organizationRoutes.post(
@@ -92,6 +97,9 @@ def register_to_organization(
 def get_all_users(
     limit: int = Query(10, ge=1, le=100, description="number of results to retrieve"),
     offset: int = Query(0, ge=0, description="Number of results to skip."),
+    cursor: Optional[str] = Query(
+        None, description="`next_cursor` of the previous page, used instead of offset."
+    ),
     sql: Session = Depends(get_db),
     organization: backendModel.SubscriptionFeature = Depends(organization_exist),
 ):
@@ -99,7 +107,7 @@ def get_all_users(
     Retrieves a specified number of users belonging to a specific organization,
     along with the total count of users.
     """
-    return controller.get_all_users(limit, offset, organization, sql)
+    return controller.get_all_users(limit, offset, organization, sql, cursor)
 
 
 @organizationRoutes.get(
@@ -138,6 +146,9 @@ def get_user_details(
 def get_all_roles(
     limit: int = Query(10, ge=1, le=100, description="number of results to retrieve"),
     offset: int = Query(0, ge=0, description="Number of results to skip."),
+    cursor: Optional[str] = Query(
+        None, description="`next_cursor` of the previous page, used instead of offset."
+    ),
     sql: Session = Depends(get_db),
     organization: backendModel.SubscriptionFeature = Depends(organization_exist),
 ):
@@ -145,7 +156,7 @@ def get_all_roles(
     Retrieves a specified number of roles belonging to a specific organization,
     along with the total count of roles.
     """
-    return controller.get_all_roles(limit, offset, organization, sql)
+    return controller.get_all_roles(limit, offset, organization, sql, cursor)
 
 
 @organizationRoutes.get(
@@ -5,7 +5,7 @@ Author: Gourav Sahu
 Date: 23/09/2023
 """
 from datetime import datetime
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -41,12 +41,20 @@ class ShowOrganization(BaseModel):
     updated_at: datetime
 
 
+class ListOrganization(ShowOrganization):
+    """
+    A pydantic model
+    """
+    total_users: int = 0
+
+
 class BasicOrganizationList(BaseModel):
     """
     A pydantic model
     """
-    total: int
-    organizations: List[ShowOrganization]
+    total: Optional[int]
+    organizations: List[ListOrganization]
+    next_cursor: Optional[str] = None
 
 
 class CreateOrganization(BaseModel):
@@ -110,8 +118,9 @@ class ShowOrgUserList(BaseModel):
     """
     A pydantic model
     """
-    total: int
+    total: Optional[int]
     users: List[ShowOrgUser]
+    next_cursor: Optional[str] = None
 
 
 class ShowOrgRole(BaseModel):
@@ -131,8 +140,9 @@ class ShowOrgRoleList(BaseModel):
     """
     A pydantic model
     """
-    total: int
+    total: Optional[int]
     roles: List[ShowOrgRole]
+    next_cursor: Optional[str] = None
 
 
 class CreateRole(BaseModel):
@@ -5,13 +5,23 @@ Author: Gourav Sahu
 Date: 05/09/2023
 """
 # pylint: disable=C0302
-import json
+import asyncio
 
+import orjson
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from sqlalchemy.orm import Session
-
+from sqlalchemy import insert, literal
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from database import (
+    insert_many_or_ignore,
+    insert_or_ignore,
+    load_options,
+    paginate,
+    update_returning,
+)
 from dependencies import (
     ALLOWED_FILE_EXTENSIONS,
     SETTINGS,
@@ -26,24 +36,61 @@ from organization import model as orgModel
 
 from . import model, schema
 
+# Request fields whose Task column has a different name
+TASK_FIELD_ALIASES = {"deadline_date": "deadline"}
+
+
+def task_load_options():
+    """
+    Returns the loader options for everything ShowTask serializes,
+    single rows are joined and collections batched with one IN query each.
+    """
+    return load_options(
+        joinedload(model.Task.creator),
+        joinedload(model.Task.parent),
+        joinedload(model.Task.group),
+        joinedload(model.Task.project),
+        selectinload(model.Task.assigned_to).options(
+            joinedload(model.UserTask.user),
+            joinedload(model.UserTask.assigned_by),
+        ),
+        selectinload(model.Task.column_values).options(
+            joinedload(model.CustomColumnAssigned.column),
+            joinedload(model.CustomColumnAssigned.value),
+        ),
+    )
+
 
 def get_projects(
-    limit: int, offset: int, organization: orgModel.Organization, sql: Session
+    limit: int,
+    offset: int,
+    organization: orgModel.Organization,
+    sql: Session,
+    cursor: str = None,
 ):
     """
     Retrieves a specified number of projects belonging to a specific organization,
     along with the total count of projects.
     """
-    count = sql.query(model.Project).filter_by(org_id=organization.id).count()
-    projects = (
+    # Everything ShowProject serializes is loaded up front, no lazy load per project
+    query = (
         sql.query(model.Project)
+        .options(
+            *load_options(
+                joinedload(model.Project.creator),
+                selectinload(model.Project.columns).options(
+                    joinedload(model.CustomColumn.creator),
+                    selectinload(model.CustomColumn.values),
+                ),
+            )
+        )
         .filter_by(org_id=organization.id)
-        .limit(limit)
-        .offset(offset)
-        .all()
+    )
+    projects, count, next_cursor = paginate(
+        query, model.Project.id, limit, offset, cursor
     )
 
-    return {"total": count, "projects": projects}
+    return {"total": count, "projects": projects, "next_cursor": next_cursor}
 
 
 def project_details(project_id: str, organization: orgModel.Organization, sql: Session):
@@ -76,14 +123,19 @@ def create_project(
     Creates a new project for an organization in the database,
     ensure that the project name is unique within the organization.
     """
-    # Check if a project with the same name already exists in the organization.
-    exist_name = (
-        sql.query(model.Project)
-        .filter_by(project_name=data.project_name, org_id=organization.id)
-        .first()
+    # Create the project unless one with the same name exists in the organization.
+    project = insert_or_ignore(
+        sql,
+        model.Project,
+        {
+            "project_name": data.project_name,
+            "description": data.description,
+            "created_by": authtoken.user_id,
+            "org_id": organization.id,
+        },
+        ["project_name", "org_id"],
     )
-
-    if exist_name:
+    if not project:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
             loc="project_name",
@@ -91,19 +143,7 @@ def create_project(
             inp=data.project_name,
             ctx={"project_name": "unique"},
         )
-
-    # Create a new project object
-    project = model.Project(
-        puid=generate_uuid(data.project_name),
-        project_name=data.project_name,
-        description=data.description,
-        created_by=authtoken.user_id,
-        org_id=organization.id,
-    )
-
-    sql.add(project)
     sql.commit()
-    sql.refresh(project)
 
     return project
 
@@ -114,26 +154,21 @@ def update_project(
     """
     Updates the details of a project in the database.
     """
-    project = (
-        sql.query(model.Project)
-        .filter_by(puid=data.project_id, org_id=organization.id)
-        .first()
+    criteria = (
+        model.Project.puid == data.project_id,
+        model.Project.org_id == organization.id,
     )
-    if not project:
-        CustomValidations.raize_custom_error(
-            error_type="not_exist",
-            loc="project_id",
-            msg="Project does not exist",
-            inp=data.project_id,
-            ctx={"project_id": "exist"},
-        )
 
-    if data.project_name:
-        exist_name = (
+    # Only the fields the client actually sent are written
+    patch = data.model_dump(
+        exclude_unset=True, exclude_none=True, exclude={"project_id"}
+    )
+    if "project_name" in patch:
+        exist_name = sql.query(
             sql.query(model.Project)
             .filter_by(project_name=data.project_name, org_id=organization.id)
-            .first()
-        )
+            .exists()
+        ).scalar()
         if exist_name:
             CustomValidations.raize_custom_error(
                 error_type="already_exist",
@@ -142,14 +177,22 @@ def update_project(
                 inp=data.project_name,
                 ctx={"project_name": "unique"},
             )
-        project.project_name = data.project_name
 
-    project.description = data.description or project.description
-    project.is_active = data.is_active or project.is_active
-    project.is_deleted = data.is_deleted or project.is_deleted
+    # The lookup and the write are a single UPDATE ... RETURNING
+    if patch:
+        project = update_returning(sql, model.Project, criteria, patch)
+    else:
+        project = sql.query(model.Project).filter(*criteria).first()
+    if not project:
+        CustomValidations.raize_custom_error(
+            error_type="not_exist",
+            loc="project_id",
+            msg="Project does not exist",
+            inp=data.project_id,
+            ctx={"project_id": "exist"},
+        )
 
     sql.commit()
-    sql.refresh(project)
     return project
 
 
@@ -164,7 +207,7 @@ def create_task(
     """
     # Check if the project specified by the project ID exists in the organization
     exist_project = (
-        sql.query(model.Project)
+        sql.query(model.Project.id)
         .filter_by(puid=data.project_id, org_id=organization.id)
         .first()
     )
@@ -177,40 +220,11 @@ def create_task(
             ctx={"project_id": "exist"},
         )
 
-    # Check if a task with the same name already exists in the project
-    exist_name = (
-        sql.query(model.Task)
-        .filter_by(task_name=data.task_name, project_id=exist_project.id)
-        .first()
-    )
-    if exist_name:
-        CustomValidations.raize_custom_error(
-            error_type="already_exist",
-            loc="task_name",
-            msg="Task name already exists",
-            inp=data.task_name,
-            ctx={"task_name": "unique"},
-        )
-
-    # Create a new task object
-    task = model.Task(
-        tuid=generate_uuid(data.task_name),
-        task_name=data.task_name,
-        description=data.description,
-        created_by=authtoken.user_id,
-        project_id=exist_project.id,
-    )
-
-    task.event_id = data.event_id or task.event_id
-    task.estimate_hours = data.estimate_hours or task.estimate_hours
-    task.deadline = data.deadline_date or task.deadline
-    task.start_date = data.start_date or task.start_date
-    task.end_date = data.end_date or task.end_date
-
+    group_id = None
     if data.group_id is not None:
         # If the task group does not exist, raise a custom error
         group_task = (
-            sql.query(model.TaskGroup)
+            sql.query(model.TaskGroup.id)
             .join(model.Project, model.TaskGroup.project_id == model.Project.id)
             .filter(
                 # pylint: disable=singleton-comparison
@@ -228,11 +242,12 @@ def create_task(
                 inp=data.group_id,
             )
 
-        task.group_id = group_task.id
+        group_id = group_task.id
 
+    parent_id = None
     if data.parent_id is not None:
         parent_task = (
-            sql.query(model.Task)
+            sql.query(model.Task.id)
             .join(model.Project, model.Task.project_id == model.Project.id)
             .filter(
                 model.Task.tuid == data.parent_id,
@@ -240,7 +255,7 @@ def create_task(
             )
             .first()
         )
-        if not task:
+        if not parent_task:
             CustomValidations.raize_custom_error(
                 error_type="not_exist",
                 loc="parent_id",
@@ -248,11 +263,36 @@ def create_task(
                 inp=data.parent_id,
                 ctx={"parent_id": "exist"},
             )
-        task.parent_id = parent_task.id
-
-    sql.add(task)
+        parent_id = parent_task.id
+
+    # Create the task unless one with the same name exists in the project
+    task = insert_or_ignore(
+        sql,
+        model.Task,
+        {
+            "task_name": data.task_name,
+            "description": data.description,
+            "created_by": authtoken.user_id,
+            "project_id": exist_project.id,
+            "group_id": group_id,
+            "parent_id": parent_id,
+            "event_id": data.event_id,
+            "estimate_hours": data.estimate_hours,
+            "deadline": data.deadline_date,
+            "start_date": data.start_date,
+            "end_date": data.end_date,
+        },
+        ["task_name", "project_id"],
+    )
+    if not task:
+        CustomValidations.raize_custom_error(
+            error_type="already_exist",
+            loc="task_name",
+            msg="Task name already exists",
+            inp=data.task_name,
+            ctx={"task_name": "unique"},
+        )
     sql.commit()
-    sql.refresh(task)
     return task
 
 
@@ -289,18 +329,22 @@ async def upload_task_media(
             ctx={"google token": "exist"},
         )
 
+    # Rows saved while `gtoken` was a TEXT column hold the token as a JSON string
+    gtoken = organization.gtoken
+    if isinstance(gtoken, str):
+        gtoken = orjson.loads(gtoken)
+
     # Create an instance of OAuth 2.0 credentials using the dictionary
-    creds = Credentials.from_authorized_user_info(json.loads(organization.gtoken))
+    creds = Credentials.from_authorized_user_info(gtoken)
 
-    # Check if the Google token provided is valid.
+    # Google calls block, so they run in the threadpool instead of the event loop
     if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
+        await run_in_threadpool(creds.refresh, Request())
 
     folder_path = f"{SETTINGS.APP_NAME}/media/{organization.org_name}/{task.task_name}"
-    folder = create_folder_if_not_exists(folder_path, creds)
+    folder = await run_in_threadpool(create_folder_if_not_exists, folder_path, creds)
 
-    file_ids = {}
-    for index, file in enumerate(files):
+    for file in files:
         if not allowed_file(file.filename, ALLOWED_FILE_EXTENSIONS):
             CustomValidations.raize_custom_error(
                 error_type="invalid",
@@ -310,8 +354,15 @@ async def upload_task_media(
                 ctx={"image": "invalid type"},
             )
 
-        created_file = await upload_to_drive(file, creds, folder["id"])
-        file_ids[index] = created_file.get("id", "")
+    # Every file is checked before uploading them concurrently,
+    # the results keep the order of `files`
+    created_files = await asyncio.gather(
+        *(upload_to_drive(file, creds, folder["id"]) for file in files)
+    )
+    file_ids = {
+        index: created_file.get("id", "")
+        for index, created_file in enumerate(created_files)
+    }
 
     task.medias = file_ids
     sql.commit()
@@ -325,18 +376,36 @@ def get_tasks(
     organization: orgModel.Organization,
     project_id: str | None,
     sql: Session,
+    cursor: str = None,
 ):
     """
     Retrieves a specified number of tasks from the database,
     either for a specific project within an organization or
     for all tasks in the organization.
     """
-    if project_id is not None:
-        # Check if the project specified by the project ID exists in the organization
+    if project_id is None:
+        query = sql.query(model.Task).options(*task_load_options())
+        tasks, count, next_cursor = paginate(
+            query, model.Task.id, limit, offset, cursor
+        )
+        return {"total": count, "tasks": tasks, "next_cursor": next_cursor}
+
+    project_filter = (
+        model.Project.puid == project_id,
+        model.Project.org_id == organization.id,
+    )
+    query = (
+        sql.query(model.Task)
+        .join(model.Project, model.Task.project_id == model.Project.id)
+        .options(*task_load_options())
+        .filter(*project_filter)
+    )
+    tasks, count, next_cursor = paginate(query, model.Task.id, limit, offset, cursor)
+
+    # An empty page is the only case where the project may not exist
+    if not tasks:
         exist_project = (
-            sql.query(model.Project)
-            .filter_by(puid=project_id, org_id=organization.id)
-            .first()
+            sql.query(literal(1)).filter(*project_filter).limit(1).scalar()
         )
         if not exist_project:
             CustomValidations.raize_custom_error(
@@ -347,27 +416,7 @@ def get_tasks(
                 ctx={"project_id": "exist"},
             )
 
-        count = sql.query(model.Task).filter_by(project_id=exist_project.id).count()
-
-        tasks = (
-            sql.query(model.Task)
-            .filter_by(project_id=exist_project.id)
-            .order_by(model.Task.id)
-            .limit(limit)
-            .offset(offset)
-            .all()
-        )
-    else:
-        count = sql.query(model.Task).count()
-        tasks = (
-            sql.query(model.Task)
-            .limit(limit)
-            .order_by(model.Task.id)
-            .offset(offset)
-            .all()
-        )
-
-    return {"total": count, "tasks": tasks}
+    return {"total": count, "tasks": tasks, "next_cursor": next_cursor}
 
 
 def update_task(
@@ -376,36 +425,25 @@ def update_task(
     """
     Updates the details of a task in the database based on the provided input data.
     """
-    task = (
-        sql.query(model.Task)
-        .join(model.Project, model.Task.project_id == model.Project.id)
-        .filter(
-            model.Task.tuid == data.task_id, model.Project.org_id == organization.id
-        )
-        .first()
+    criteria = (
+        model.Task.tuid == data.task_id,
+        model.Task.project_id == model.Project.id,
+        model.Project.org_id == organization.id,
     )
-    if not task:
-        CustomValidations.raize_custom_error(
-            error_type="not_exist",
-            loc="task_id",
-            msg="Task does not exist",
-            inp=data.task_id,
-            ctx={"task_id": "exist"},
-        )
 
-    task.task_name = data.task_name or task.task_name
-    task.description = data.description or task.description
-    task.event_id = data.event_id or task.event_id
-    task.estimate_hours = data.estimate_hours or task.estimate_hours
-    task.deadline = data.deadline_date or task.deadline
-    task.start_date = data.start_date or task.start_date
-    task.end_date = data.end_date or task.end_date
-    task.is_active = data.is_active or task.is_active
-    task.is_deleted = data.is_deleted or task.is_deleted
+    # Only the fields the client actually sent are written
+    patch = data.model_dump(
+        exclude_unset=True,
+        exclude_none=True,
+        exclude={"task_id", "group_id", "parent_id"},
+    )
+    for field, column in TASK_FIELD_ALIASES.items():
+        if field in patch:
+            patch[column] = patch.pop(field)
 
     if data.group_id is not None:
         group_task = (
-            sql.query(model.TaskGroup)
+            sql.query(model.TaskGroup.id)
             .join(model.Project, model.TaskGroup.project_id == model.Project.id)
             .filter(
                 # pylint: disable=singleton-comparison
@@ -422,11 +460,11 @@ def update_task(
                 msg="Group does not exist",
                 inp=data.group_id,
             )
-        task.group_id = group_task.id
+        patch["group_id"] = group_task.id
 
     if data.parent_id is not None:
         parent_task = (
-            sql.query(model.Task)
+            sql.query(model.Task.id)
             .join(model.Project, model.Task.project_id == model.Project.id)
             .filter(
                 model.Task.tuid == data.parent_id,
@@ -434,7 +472,7 @@ def update_task(
             )
             .first()
         )
-        if not task:
+        if not parent_task:
             CustomValidations.raize_custom_error(
                 error_type="not_exist",
                 loc="parent_id",
@@ -442,11 +480,23 @@ def update_task(
                 inp=data.parent_id,
                 ctx={"parent_id": "exist"},
             )
-        task.parent_id = parent_task.id
+        patch["parent_id"] = parent_task.id
 
-    sql.commit()
-    sql.refresh(task)
+    # The lookup and the write are a single UPDATE ... FROM ... RETURNING
+    if patch:
+        task = update_returning(sql, model.Task, criteria, patch)
+    else:
+        task = sql.query(model.Task).filter(*criteria).first()
+    if not task:
+        CustomValidations.raize_custom_error(
+            error_type="not_exist",
+            loc="task_id",
+            msg="Task does not exist",
+            inp=data.task_id,
+            ctx={"task_id": "exist"},
+        )
 
+    sql.commit()
     return task
 
 
@@ -496,32 +546,59 @@ def assign_project_permission(
             ctx={"user_id": "exist"},
         )
 
-    # Retrieve the requested permissions from the database
-    permissions = (
-        sql.query(model.ProjectPermission)
-        .filter(model.ProjectPermission.codename.in_(data.permissions))
-        .all()
-    )
-
     # Delete any existing project permissions for the user
     sql.query(model.ProjectUserPermission).filter_by(
         user_id=user.id, project_id=project.id
     ).delete()
 
-    # Assign new project permissions for the user
-    proj_permissions = [
-        model.ProjectUserPermission(
-            user_id=user.id, project_id=project.id, permission_id=permission.id
-        )
-        for permission in permissions
+    # Assign the requested project permissions, ids come from the cached catalog
+    permission_ids = model.proj_permission_ids(sql.get_bind())
+    rows = [
+        {
+            "user_id": user.id,
+            "project_id": project.id,
+            "permission_id": permission_ids[codename],
+        }
+        for codename in dict.fromkeys(data.permissions)
+        if codename in permission_ids
     ]
-
-    # Add the new project permissions to the database
-    sql.add_all(proj_permissions)
+    if rows:
+        sql.execute(insert(model.ProjectUserPermission), rows)
     sql.commit()
     return project
 
 
+def get_task_users(
+    data: schema.AssignTask, organization: orgModel.Organization, sql: Session
+):
+    """
+    Returns the ids of the organization users listed in `data.user_ids`,
+    raises an error naming the ones that are not members of the organization.
+    """
+    users = (
+        sql.query(orgModel.OrganizationUser.id, frontendModel.FrontendUser.uuid)
+        .join(
+            frontendModel.FrontendUser,
+            orgModel.OrganizationUser.user_id == frontendModel.FrontendUser.id,
+        )
+        .filter(
+            orgModel.OrganizationUser.org_id == organization.id,
+            frontendModel.FrontendUser.uuid.in_(data.user_ids),
+        )
+        .all()
+    )
+    missing = set(data.user_ids) - {user.uuid for user in users}
+    if missing:
+        CustomValidations.raize_custom_error(
+            error_type="not_exist",
+            loc="user_ids",
+            msg="User does not exist",
+            inp=", ".join(sorted(missing)),
+            ctx={"user_ids": "exist"},
+        )
+    return [user.id for user in users]
+
+
 def assign_task(
     data: schema.AssignTask,
     auth_token: frontendModel.FrontendToken,
@@ -541,42 +618,18 @@ def assign_task(
             ctx={"task_id": "exist"},
         )
 
-    # Check user exist in this organization
-    user = (
-        sql.query(orgModel.OrganizationUser)
-        .join(
-            frontendModel.FrontendUser,
-            orgModel.OrganizationUser.user_id == frontendModel.FrontendUser.id,
-        )
-        .filter(
-            orgModel.OrganizationUser.org_id == organization.id,
-            frontendModel.FrontendUser.uuid == data.user_id,
-        )
-        .first()
+    user_ids = get_task_users(data, organization, sql)
+
+    # Users who already have the task are skipped by the unique constraint
+    insert_many_or_ignore(
+        sql,
+        model.UserTask,
+        [
+            {"task_id": task.id, "user_id": user_id, "created_by": auth_token.user_id}
+            for user_id in user_ids
+        ],
+        ["task_id", "user_id"],
     )
-    if not user:
-        CustomValidations.raize_custom_error(
-            error_type="not_exist",
-            loc="user_id",
-            msg="User does not exist",
-            inp=data.user_id,
-            ctx={"user_id": "exist"},
-        )
-
-    user_task = (
-        sql.query(model.UserTask)
-        .filter_by(
-            task_id=task.id,
-            user_id=user.id,
-        )
-        .first()
-    )
-    if not user_task:
-        user_task = model.UserTask(
-            task_id=task.id, user_id=user.id, created_by=auth_token.user_id
-        )
-
-    sql.add(user_task)
     sql.commit()
     return task
 
@@ -585,7 +638,7 @@ def withdraw_task(
     data: schema.AssignTask, organization: orgModel.Organization, sql: Session
 ):
     """
-    Withdraws a task assigned to a user in an organization.
+    Withdraws a task assigned to users in an organization.
     """
     task = sql.query(model.Task).filter_by(tuid=data.task_id).first()
     if not task:
@@ -597,30 +650,11 @@ def withdraw_task(
             ctx={"task_id": "exist"},
         )
 
-    user = (
-        sql.query(orgModel.OrganizationUser)
-        .join(
-            frontendModel.FrontendUser,
-            orgModel.OrganizationUser.user_id == frontendModel.FrontendUser.id,
-        )
-        .filter(
-            orgModel.OrganizationUser.org_id == organization.id,
-            frontendModel.FrontendUser.uuid == data.user_id,
-        )
-        .first()
-    )
-    if not user:
-        CustomValidations.raize_custom_error(
-            error_type="not_exist",
-            loc="user_id",
-            msg="User does not exist",
-            inp=data.user_id,
-            ctx={"user_id": "exist"},
-        )
+    user_ids = get_task_users(data, organization, sql)
 
-    sql.query(model.UserTask).filter_by(
-        task_id=task.id,
-        user_id=user.id,
+    sql.query(model.UserTask).filter(
+        model.UserTask.task_id == task.id,
+        model.UserTask.user_id.in_(user_ids),
     ).delete()
 
     sql.commit()
@@ -655,11 +689,11 @@ def project_custom_column(
             inp=data.project_id,
         )
 
-    existing_column_name = (
+    existing_column_name = sql.query(
         sql.query(model.CustomColumn)
         .filter_by(column_name=data.column_name, project_id=project.id)
-        .first()
-    )
+        .exists()
+    ).scalar()
     if existing_column_name:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
@@ -877,7 +911,6 @@ def remove_column_value(
             model.Project.is_deleted == False,  # proect is not deleted
         )
     )
-    print(column_sql)
     column = column_sql.first()
     if not column:
         CustomValidations.raize_custom_error(
@@ -950,11 +983,11 @@ def create_task_group(
             inp=data.project_id,
         )
 
-    title_exist = (
+    title_exist = sql.query(
         sql.query(model.TaskGroup)
         .filter_by(title=data.group_title, project_id=project.id)
-        .first()
-    )
+        .exists()
+    ).scalar()
     if title_exist:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
@@ -1004,11 +1037,11 @@ def update_task_group(
         )
 
     # Check if the new group title already exists in the project. If it does, raise a custom error
-    title_exist = (
+    title_exist = sql.query(
         sql.query(model.TaskGroup)
         .filter_by(title=data.group_title, project_id=group_task.project_id)
-        .first()
-    )
+        .exists()
+    ).scalar()
     if title_exist:
         CustomValidations.raize_custom_error(
             error_type="already_exist",
@@ -1085,7 +1118,13 @@ def get_all_task_comments(limit, offset, sql: Session):
     """
     Retrieves all comments for tasks with pagination.
     """
-    all_task_comments = sql.query(model.Comments).limit(limit).offset(offset).all()
+    all_task_comments = (
+        sql.query(model.Comments)
+        .options(*load_options(joinedload(model.Comments.creator)))
+        .limit(limit)
+        .offset(offset)
+        .all()
+    )
     total = sql.query(model.Comments.id).count()
 
     return {"result": all_task_comments, "total": total}
@@ -4,8 +4,6 @@ taskmanagement/model.py
 Author: Gourav Sahu
 Date: 05/09/2023
 """
-from datetime import datetime
-
 from sqlalchemy import (
     JSON,
     Boolean,
@@ -15,11 +13,14 @@ from sqlalchemy import (
     Integer,
     String,
     Text,
+    UniqueConstraint,
     exc,
+    insert,
+    select,
 )
 from sqlalchemy.orm import relationship
 
-from database import Base, SessionLocal
+from database import Base, SessionLocal, random_uid, utc_timestamp
 from dependencies import predefined_project_permissions
 
 
@@ -29,17 +30,24 @@ class Project(Base):
     """
 
     __tablename__ = "projects"
+    __table_args__ = (UniqueConstraint("project_name", "org_id"),)
+    # Read back the database timestamps with the INSERT / UPDATE itself
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    puid = Column(String(50), index=True, unique=True)
+    puid = Column(
+        String(50), index=True, unique=True, nullable=False, server_default=random_uid()
+    )
     project_name = Column(String(50), nullable=False)
     description = Column(Text, nullable=True)
     created_by = Column(Integer, ForeignKey("frontendusers.id"))
     org_id = Column(Integer, ForeignKey("organizations.id"))
     is_active = Column(Boolean, default=True)
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(
+        DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp()
+    )
 
     creator = relationship("FrontendUser", foreign_keys=created_by)
     columns = relationship("CustomColumn", back_populates="project")
@@ -68,9 +76,14 @@ class Task(Base):
     """
 
     __tablename__ = "tasks"
+    __table_args__ = (UniqueConstraint("task_name", "project_id"),)
+    # Read back the database timestamps with the INSERT / UPDATE itself
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    tuid = Column(String(50), index=True, unique=True)
+    tuid = Column(
+        String(50), index=True, unique=True, nullable=False, server_default=random_uid()
+    )
     group_id = Column(Integer, ForeignKey("task_groups.id"), nullable=True)
     task_name = Column(String(50), nullable=False)
     description = Column(Text, nullable=True)
@@ -85,8 +98,10 @@ class Task(Base):
     is_active = Column(Boolean, default=True)
     is_deleted = Column(Boolean, default=False)
     medias = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(
+        DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp()
+    )
 
     creator = relationship("FrontendUser", foreign_keys=created_by)
     parent = relationship("Task", foreign_keys=parent_id)
@@ -132,8 +147,8 @@ class TaskGroup(Base):
     project_id = Column(Integer, ForeignKey("projects.id"))
     created_by = Column(Integer, ForeignKey("frontendusers.id"))
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp())
 
     project = relationship("Project", foreign_keys=project_id)
     tasks = relationship("Task", back_populates="group")
@@ -172,6 +187,25 @@ class ProjectPermission(Base):
         return f"Project Permission: {self.permission}"
 
 
+# Codename -> id of the project permissions, see `proj_permission_ids`
+PROJ_PERMISSION_IDS: dict[str, int] = {}
+
+
+def proj_permission_ids(bind) -> dict[str, int]:
+    """
+    Returns the project permission ids by codename.
+    The catalog only changes when it is seeded, so it is read once and kept;
+    an empty catalog is not kept, it is read again until the seed has run.
+    """
+    if not PROJ_PERMISSION_IDS:
+        with bind.connect() as connection:
+            rows = connection.execute(
+                select(ProjectPermission.codename, ProjectPermission.id)
+            )
+            PROJ_PERMISSION_IDS.update(rows.all())
+    return PROJ_PERMISSION_IDS
+
+
 def create_proj_permissions():
     """
     Create predefined project permissions in the database.
@@ -179,12 +213,9 @@ def create_proj_permissions():
     try:
         print("Creating project permissions data...")
         sql = SessionLocal()
-        permissions = [
-            ProjectPermission(**permission)
-            for permission in predefined_project_permissions
-        ]
-        sql.add_all(permissions)
+        sql.execute(insert(ProjectPermission), predefined_project_permissions)
         sql.commit()
+        PROJ_PERMISSION_IDS.clear()
         return {"message": "Project Permissions created successfully"}
     except exc.IntegrityError as error:
         sql.rollback()
@@ -202,6 +233,7 @@ class ProjectUserPermission(Base):
     """
 
     __tablename__ = "project_user_permissions"
+    __table_args__ = (UniqueConstraint("user_id", "project_id", "permission_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("frontendusers.id"), nullable=True)
@@ -224,16 +256,6 @@ class ProjectUserPermission(Base):
             ")"
         )
 
-    def __str__(self):
-        return (
-            "ProjectUserPermission("
-            f"id={self.id}, "
-            f"user_id={self.user_id}, "
-            f"project_id={self.project_id}, "
-            f"permission_id={self.permission_id}"
-            ")"
-        )
-
 
 class UserTask(Base):
     """
@@ -241,13 +263,18 @@ class UserTask(Base):
     """
 
     __tablename__ = "user_tasks"
+    __table_args__ = (UniqueConstraint("task_id", "user_id"),)
+    # Read back the database timestamps with the INSERT / UPDATE itself
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey("tasks.id"))
     user_id = Column(Integer, ForeignKey("frontendusers.id"))
     created_by = Column(Integer, ForeignKey("frontendusers.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(
+        DateTime, server_default=utc_timestamp(), onupdate=utc_timestamp()
+    )
 
     task = relationship("Task", foreign_keys=task_id)
     user = relationship("FrontendUser", foreign_keys=user_id)
@@ -263,16 +290,6 @@ class UserTask(Base):
             ")"
         )
 
-    def __str__(self):
-        return (
-            "ProjectUserPermission("
-            f"id={self.id}, "
-            f"user_id={self.user_id}, "
-            f"project_id={self.task_id}, "
-            f"permission_id={self.created_by}"
-            ")"
-        )
-
 
 class CustomColumn(Base):
     """
@@ -290,8 +307,8 @@ class CustomColumn(Base):
     created_by = Column(Integer, ForeignKey("frontendusers.id"))
     is_deleted = Column(Boolean, default=False)
     deleted_by = Column(Integer, ForeignKey("frontendusers.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp())
 
     creator = relationship("FrontendUser", foreign_keys=created_by)
     project = relationship("Project", foreign_keys=project_id)
@@ -306,15 +323,6 @@ class CustomColumn(Base):
             ")"
         )
 
-    def __str__(self):
-        return (
-            "CustomColumn("
-            f"id={self.id}, "
-            f"cuid='{self.cuid}', "
-            f"column_name='{self.column_name}'"
-            ")"
-        )
-
 
 class CustomColumnExpected(Base):
     """
@@ -331,8 +339,8 @@ class CustomColumnExpected(Base):
     )
     column_id = Column(Integer, ForeignKey("custom_columns.id"))
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp())
 
     column = relationship("CustomColumn", foreign_keys=column_id)
 
@@ -355,8 +363,8 @@ class CustomColumnAssigned(Base):
     value_id = Column(Integer, ForeignKey("custom_column_expected_values.id"))
     column_id = Column(Integer, ForeignKey("custom_columns.id"))
     task_id = Column(Integer, ForeignKey("tasks.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp())
 
     column = relationship("CustomColumn", foreign_keys=column_id)
     task = relationship(
@@ -397,8 +405,8 @@ class Comments(Base):
     user_id = Column(Integer, ForeignKey("frontendusers.id"))
     is_deleted = Column(Boolean, default=False)
     task_id = Column(Integer, ForeignKey("tasks.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_timestamp())
+    updated_at = Column(DateTime, server_default=utc_timestamp())
     parent_id = Column(Integer, ForeignKey("comments.id"))
 
     creator = relationship("FrontendUser", foreign_keys=user_id)
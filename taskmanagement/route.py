@@ -56,6 +56,9 @@ def create_project(
 def get_projects(
     limit: int = Query(10, ge=1, le=100, description="number of results to retrieve"),
     offset: int = Query(0, ge=0, description="Number of results to skip."),
+    cursor: Optional[str] = Query(
+        None, description="`next_cursor` of the previous page, used instead of offset."
+    ),
     organization: orgModel.Organization = Depends(organization_exist),
     sql: Session = Depends(get_db),
 ):
@@ -63,7 +66,7 @@ def get_projects(
     Retrieves a specified number of projects belonging to a specific organization,
     along with the total count of projects.
     """
-    return controller.get_projects(limit, offset, organization, sql)
+    return controller.get_projects(limit, offset, organization, sql, cursor)
 
 
 @taskmanagementRoutes.get(
@@ -166,6 +169,9 @@ def create_task(
 def get_tasks(
     limit: int = Query(10, ge=1, le=100, description="number of results to retrieve"),
     offset: int = Query(0, ge=0, description="Number of results to skip."),
+    cursor: Optional[str] = Query(
+        None, description="`next_cursor` of the previous page, used instead of offset."
+    ),
     project_id: str = Query(None, title="project ID", description="puid of a project"),
     organization: orgModel.Organization = Depends(organization_exist),
     sql: Session = Depends(get_db),
@@ -175,7 +181,9 @@ def get_tasks(
     either for a specific project within an organization or
     for all tasks in the organization.
     """
-    return controller.get_tasks(limit, offset, organization, project_id, sql)
+    return controller.get_tasks(
+        limit, offset, organization, project_id, sql, cursor
+    )
 
 
 @taskmanagementRoutes.post(
@@ -229,7 +237,7 @@ def update_task(
     "/assign-task",
     response_model=schema.ShowTask,
     status_code=status.HTTP_201_CREATED,
-    description="Assign a task to a user.",
+    description="Assign a task to users.",
     name="Assign task",
 )
 def assign_task(
@@ -249,7 +257,7 @@ def assign_task(
     response_model=schema.ShowTask,
     dependencies=[Depends(authenticate_token)],
     status_code=status.HTTP_200_OK,
-    description="Withdraw a task from a user.",
+    description="Withdraw a task from users.",
     name="Withdreaw task",
 )
 def withdraw_task(
@@ -258,7 +266,7 @@ def withdraw_task(
     sql: Session = Depends(get_db),
 ):
     """
-    Withdraws a task assigned to a user in an organization.
+    Withdraws a task assigned to users in an organization.
     """
     return controller.withdraw_task(data, organization, sql)
 
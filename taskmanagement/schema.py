@@ -152,8 +152,9 @@ class TaskList(BaseModel):
     """
     A pydantic model
     """
-    total: int
+    total: Optional[int]
     tasks: List[ShowTask]
+    next_cursor: Optional[str] = None
 
 
 class CreateTask(BaseModel):
@@ -292,7 +293,9 @@ class AssignTask(BaseModel):
     A pydantic model
     """
     task_id: str = Field(title="Task ID", description="tuid of the task to assign")
-    user_id: str = Field(title="User ID", description="UUID of frontend user.")
+    user_ids: List[str] = Field(
+        min_length=1, title="User IDs", description="UUIDs of frontend users."
+    )
 
 
 class ResponseCustomColumn(BaseModel):
@@ -327,8 +330,9 @@ class ProjectList(BaseModel):
     """
     A pydantic model
     """
-    total: int
+    total: Optional[int]
     projects: List[ShowProject]
+    next_cursor: Optional[str] = None
 
 
 class CreateCustomColumnExpected(BaseModel):